@@ -0,0 +1,16 @@
+{#
+    One row per platform named in the whitespace separated platforms column,
+    aliased as platform. BigQuery and DuckDB split strings and unnest arrays
+    with different syntax, so each adapter gets its own implementation.
+#}
+{% macro unnest_platforms(column) %}
+    {{ return(adapter.dispatch("unnest_platforms")(column)) }}
+{% endmacro %}
+
+{% macro default__unnest_platforms(column) %}
+    unnest(split(regexp_replace({{ column }}, r'[\s]+', ','), ',')) as platform
+{% endmacro %}
+
+{% macro duckdb__unnest_platforms(column) %}
+    unnest(string_split(regexp_replace({{ column }}, '\s+', ',', 'g'), ',')) as t(platform)
+{% endmacro %}
@@ -4,12 +4,7 @@ with exploded_platforms as (
     appid,
     trim(lower(platform)) as platform
   from {{ ref('stg_steam_store') }},
-  unnest(
-    split(
-      regexp_replace(platforms, r'[\s]+', ','),
-      ','
-    )
-  ) as platform
+  {{ unnest_platforms('platforms') }}
 )
 
 select
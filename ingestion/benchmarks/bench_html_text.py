@@ -0,0 +1,46 @@
+"""
+Compare html_to_text with the BeautifulSoup get_text it replaces.
+
+Run from the ingestion directory:
+    python -m benchmarks.bench_html_text
+"""
+
+import random
+import timeit
+
+from bs4 import BeautifulSoup
+
+from benchmarks.synthetic import store_description, supported_languages
+from src.helpers.html_text import html_to_text
+
+
+def bs4_text(text):
+    return BeautifulSoup(text, "lxml").get_text("\n", strip=True)
+
+
+def main(n_apps: int = 500, repeat: int = 3):
+    rng = random.Random(0)
+    # the five html fields parsed per app
+    fields = []
+    for _ in range(n_apps):
+        fields.append(store_description(rng))
+        fields.append(store_description(rng))
+        fields.append(store_description(rng, n_sections=1))
+        fields.append(supported_languages(rng))
+        fields.append(store_description(rng, n_sections=1))
+
+    mismatches = [text for text in fields if html_to_text(text) != bs4_text(text)]
+    if mismatches:
+        raise AssertionError(f"{len(mismatches)} fields differ from BeautifulSoup")
+
+    for name, func in [("BeautifulSoup", bs4_text), ("html_to_text", html_to_text)]:
+        seconds = min(
+            timeit.repeat(
+                lambda: [func(text) for text in fields], number=1, repeat=repeat
+            )
+        )
+        print(f"{name:>14}: {seconds / n_apps * 1e6:8.1f} us/app")
+
+
+if __name__ == "__main__":
+    main()
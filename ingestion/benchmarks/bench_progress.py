@@ -0,0 +1,64 @@
+"""
+Compare per-row INFO logging in the clean resources with ProgressLogger.
+
+Log records go to a stream handler writing to /dev/null, so the timings
+include formatting and writing each line the way a deployed run would.
+
+Run from the ingestion directory:
+    python -m benchmarks.bench_progress
+"""
+
+import os
+import time
+import random
+import logging
+
+import pandas as pd
+
+from benchmarks.synthetic import steamspy_details, store_details
+from src.helpers.progress import ProgressLogger
+from src.helpers.steamspy_cleaner import GameDetailsProcessor
+from src.helpers.steamstore_cleaner import SteamStoreProcessor
+
+
+def per_row(data: pd.DataFrame, log: logging.Logger) -> int:
+    """The original resources, one formatted log line per row"""
+    rows = 0
+    for _data in data.to_dict(orient="records"):
+        log.info(f"We are logging steam_user_tags{_data}")
+        rows += 1
+    return rows
+
+
+def sampled(data: pd.DataFrame, log: logging.Logger) -> int:
+    rows = 0
+    progress = ProgressLogger("Loading steam_user_tags", log=log)
+    for _data in progress.track(data.to_dict(orient="records")):
+        rows += 1
+    return rows
+
+
+def main(n_apps: int = 20_000):
+    log = logging.getLogger("bench_progress")
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    devnull = open(os.devnull, "w")
+    log.addHandler(logging.StreamHandler(devnull))
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rng = random.Random(0)
+    _, tags = GameDetailsProcessor().clean(steamspy_details(rng, n_apps))
+    store = SteamStoreProcessor(store_details(rng, n_apps // 10)).clean()
+
+    for name, data in [("steam_user_tags", tags), ("steam_store", store)]:
+        print(f"{len(data)} {name} rows")
+        for label, resource in [("per-row logging", per_row), ("sampled", sampled)]:
+            start = time.perf_counter()
+            rows = resource(data, log)
+            seconds = time.perf_counter() - start
+            print(f"   {label:>16}: {rows / seconds:>12,.0f} rows/s")
+    devnull.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Compare loading store records as dicts with the columnar raw staging.
+
+Reports the size of a batch as json and as staged parquet, the share of the
+staged bytes a read of the developers list touches, and the extract and
+normalize throughput of dlt on the dicts against the staged arrow tables.
+Nothing is loaded, the duckdb destination only sets up the pipelines.
+
+Run from the ingestion directory:
+    python -m benchmarks.bench_staging
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import tempfile
+from datetime import datetime
+
+import dlt
+import pyarrow.parquet as pq
+
+from benchmarks.synthetic import store_payload
+from src.apis.steam_metadetails import process_steam_data
+from src.helpers.staging import RawStaging, STEAM_STORE_SCHEMA, normalize_table
+from src.models.pydantic_models import SteamGameMetadata, validate_records
+
+TABLE = "steam_metadata_table_test"
+
+
+def extract_and_normalize(tmp: str, name: str, data) -> float:
+    pipeline = dlt.pipeline(
+        name,
+        destination=dlt.destinations.duckdb(os.path.join(tmp, f"{name}.duckdb")),
+        dataset_name="bench",
+        pipelines_dir=tmp,
+    )
+    resource = dlt.resource(
+        data,
+        name=TABLE,
+        write_disposition={"disposition": "merge", "strategy": "upsert"},
+        primary_key="appid",
+    )
+    start = time.perf_counter()
+    pipeline.extract(resource)
+    pipeline.normalize()
+    return time.perf_counter() - start
+
+
+def main(n_apps: int = 20_000):
+    # dlt warns about every arrow table whose nullability differs from its hints
+    logging.disable(logging.WARNING)
+    rng = random.Random(0)
+    date_added = datetime.now()
+    records = validate_records(
+        SteamGameMetadata,
+        [
+            process_steam_data(
+                store_payload(rng, appid)[f"{appid}"]["data"], date_added
+            )
+            for appid in range(1, n_apps + 1)
+        ],
+    )
+    dicts = [record.model_dump() for record in records]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        staging = RawStaging(tmp, "steam_store", STEAM_STORE_SCHEMA)
+        start = time.perf_counter()
+        table = staging.write(records)
+        stage_seconds = time.perf_counter() - start
+        (path,) = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(staging.directory)
+            for name in names
+        ]
+
+        json_bytes = len(json.dumps(dicts, default=str).encode())
+        parquet_bytes = os.path.getsize(path)
+        print(f"{n_apps} store records")
+        print(f"   {'json':>22}: {json_bytes / 1e6:>10.1f} MB")
+        print(f"   {'staged parquet':>22}: {parquet_bytes / 1e6:>10.1f} MB")
+
+        metadata = pq.ParquetFile(path).metadata
+        read = total = 0
+        for group in range(metadata.num_row_groups):
+            row_group = metadata.row_group(group)
+            for column in range(row_group.num_columns):
+                chunk = row_group.column(column)
+                total += chunk.total_compressed_size
+                if chunk.path_in_schema.split(".")[0] in ("appid", "developers"):
+                    read += chunk.total_compressed_size
+        print(f"   {'developers read':>22}: {read / total:>10.1%} of the file")
+
+        timings = {
+            "dicts": extract_and_normalize(tmp, "bench_dicts", dicts),
+            "staged arrow": stage_seconds
+            + extract_and_normalize(tmp, "bench_staged", normalize_table(table, TABLE)),
+        }
+    for label, seconds in timings.items():
+        print(f"   {label:>22}: {n_apps / seconds:>10,.0f} records/s")
+
+
+if __name__ == "__main__":
+    main()
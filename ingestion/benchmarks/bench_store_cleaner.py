@@ -0,0 +1,95 @@
+"""
+Compare the column-level SteamStoreProcessor platforms and description
+assembly with the original row-wise apply/agg versions.
+
+Run from the ingestion directory:
+    python -m benchmarks.bench_store_cleaner
+"""
+
+import time
+import random
+
+import pandas as pd
+
+from benchmarks.synthetic import store_details
+from src.helpers.steamstore_cleaner import SteamStoreProcessor
+
+DESCRIPTION_COLUMNS = [
+    "detailed_description",
+    "about_the_game",
+    "short_description",
+    "website",
+    "header_image",
+]
+
+
+def reference_platforms(df: pd.DataFrame) -> pd.Series:
+    platforms = df[["platform__windows", "platform__linux", "platform__mac"]]
+    return platforms.apply(
+        lambda row: " ".join([key for key, value in row.items() if value]), axis=1
+    )
+
+
+def reference_descriptions(df: pd.DataFrame) -> pd.Series:
+    return (
+        df[DESCRIPTION_COLUMNS]
+        .fillna(
+            {
+                "detailed_description": "",
+                "about_the_game": "",
+                "short_description": "",
+                "website": "Not available",
+                "header_image": "Not available",
+            }
+        )
+        .agg(
+            lambda row: f"{row['detailed_description']} {row['about_the_game']} {row['short_description']} "
+            f"Website: {row['website']} Game Image: {row['header_image']}",
+            axis=1,
+        )
+    )
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main(sizes=(10_000, 100_000)):
+    for n_apps in sizes:
+        details = store_details(random.Random(n_apps), n_apps)
+
+        expected_platforms, platforms_before = timed(
+            lambda: reference_platforms(details)
+        )
+        expected_descriptions, descriptions_before = timed(
+            lambda: reference_descriptions(details)
+        )
+
+        processor = SteamStoreProcessor(details.copy())
+        _, platforms_after = timed(processor.process_platforms)
+        _, descriptions_after = timed(processor.process_descriptions)
+
+        pd.testing.assert_series_equal(
+            processor.steam_store["platforms"],
+            expected_platforms,
+            check_names=False,
+            check_dtype=False,
+        )
+        pd.testing.assert_series_equal(
+            processor.steam_store["description"],
+            expected_descriptions,
+            check_names=False,
+            check_dtype=False,
+        )
+
+        print(f"{n_apps} rows")
+        print(f"    platforms: {platforms_before:6.2f}s -> {platforms_after:6.3f}s")
+        print(
+            f"  description: {descriptions_before:6.2f}s -> {descriptions_after:6.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Throughput and peak memory of the ingestion and cleaning hot paths.
+
+Every case runs in a fresh process, so the peak RSS reported is that of the
+case alone, and the fetchers talk to a local stub api server instead of
+Steam. Results can be saved and later compared against, failing when a
+case's throughput drops by more than the tolerance.
+
+Run from the ingestion directory:
+    python -m benchmarks.bench_suite
+    python -m benchmarks.bench_suite steamspy_clean store_clean --records 50000
+    python -m benchmarks.bench_suite --save baseline.json
+    python -m benchmarks.bench_suite --compare baseline.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from datetime import datetime, timedelta
+
+from benchmarks.stub_server import StubServer
+from benchmarks.synthetic import (
+    steamspy_details,
+    store_details,
+    store_payload,
+)
+
+
+def bench_get_request(n_records: int, server_url: str):
+    from src.apis.base_api import ApiClient
+
+    client = ApiClient()
+    url = f"{server_url}/api.php"
+    start = time.perf_counter()
+    for appid in range(1, n_records + 1):
+        client.get_request(url, {"request": "appdetails", "appid": appid})
+    return n_records, time.perf_counter() - start
+
+
+def bench_steamspy_run(n_records: int, server_url: str):
+    from src.apis.steamspy_gamedetails import SteamSpyMetadataFetcher
+
+    fetcher = SteamSpyMetadataFetcher()
+    fetcher.url = f"{server_url}/api.php"
+    start = time.perf_counter()
+    games = fetcher.run(list(range(1, n_records + 1))).games
+    return len(games), time.perf_counter() - start
+
+
+def bench_store_run(n_records: int, server_url: str):
+    from src.apis.steam_metadetails import SteamStoreMetadata
+
+    fetcher = SteamStoreMetadata()
+    fetcher.url = server_url
+    start = time.perf_counter()
+    games = fetcher.run(list(range(1, n_records + 1))).games
+    return len(games), time.perf_counter() - start
+
+
+def bench_process_steam_data(n_records: int, server_url: str):
+    from src.apis.steam_metadetails import process_steam_data
+
+    rng = random.Random(0)
+    payloads = [
+        store_payload(rng, appid)[f"{appid}"]["data"]
+        for appid in range(1, n_records + 1)
+    ]
+    date_added = datetime.now()
+    start = time.perf_counter()
+    for payload in payloads:
+        process_steam_data(payload, date_added)
+    return n_records, time.perf_counter() - start
+
+
+def bench_steamspy_clean(n_records: int, server_url: str):
+    from src.helpers.steamspy_cleaner import GameDetailsProcessor
+
+    details = steamspy_details(random.Random(0), n_records)
+    start = time.perf_counter()
+    GameDetailsProcessor().clean(details)
+    return n_records, time.perf_counter() - start
+
+
+def bench_store_clean(n_records: int, server_url: str):
+    from src.helpers.steamstore_cleaner import SteamStoreProcessor
+
+    details = store_details(random.Random(0), n_records)
+    start = time.perf_counter()
+    SteamStoreProcessor(details).clean()
+    return n_records, time.perf_counter() - start
+
+
+def bench_get_appids(n_records: int, server_url: str):
+    import dlt
+    from src.helpers.utils import get_appids
+
+    rng = random.Random(0)
+    now = datetime.now()
+    with tempfile.TemporaryDirectory() as tmp:
+        pipeline = dlt.pipeline(
+            "bench_get_appids",
+            destination=dlt.destinations.duckdb(os.path.join(tmp, "warehouse.duckdb")),
+            dataset_name="bench",
+            pipelines_dir=tmp,
+        )
+        pipeline.run(
+            [
+                {"appid": appid, "date_added": now - timedelta(days=rng.random() * 14)}
+                for appid in range(1, n_records + 1)
+            ],
+            table_name="steamspy",
+        )
+        appids = rng.sample(range(1, 2 * n_records), 100)
+        start = time.perf_counter()
+        get_appids(pipeline, "steamspy", appids)
+        seconds = time.perf_counter() - start
+    return n_records, seconds
+
+
+CASES = {
+    "get_request": (bench_get_request, 2_000),
+    "steamspy_run": (bench_steamspy_run, 2_000),
+    "store_run": (bench_store_run, 1_000),
+    "process_steam_data": (bench_process_steam_data, 5_000),
+    "steamspy_clean": (bench_steamspy_clean, 50_000),
+    "store_clean": (bench_store_clean, 50_000),
+    "get_appids": (bench_get_appids, 100_000),
+}
+
+
+def run_case(name: str, n_records: int, server_url: str, results):
+    # keep the info logging of the code under test out of the timings
+    logging.disable(logging.INFO)
+    bench, _ = CASES[name]
+    records, seconds = bench(n_records, server_url)
+    # ru_maxrss is in kilobytes on linux and bytes on macos
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+    results.put(
+        {"records": records, "seconds": seconds, "peak_rss_mb": peak_rss / 1024}
+    )
+
+
+def run(names: list, n_records: int = None) -> dict:
+    """Run each case in its own process and collect its result"""
+    report = {}
+    with StubServer() as server:
+        for name in names:
+            results = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=run_case,
+                args=(name, n_records or CASES[name][1], server.url, results),
+            )
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"{name} failed with exit code {process.exitcode}")
+            result = results.get()
+            result["records_per_second"] = result["records"] / result["seconds"]
+            report[name] = result
+            print(
+                f"{name:>20}: {result['records']:>8} records "
+                f"{result['seconds']:8.2f}s "
+                f"{result['records_per_second']:>12,.0f} records/s "
+                f"{result['peak_rss_mb']:8.0f} MB peak RSS"
+            )
+    return report
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list:
+    """Cases whose throughput fell more than tolerance below the baseline"""
+    slower = []
+    for name, result in report.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]["records_per_second"]
+        if result["records_per_second"] < expected * (1 - tolerance):
+            slower.append(
+                f"{name}: {result['records_per_second']:,.0f} records/s "
+                f"against {expected:,.0f} in the baseline"
+            )
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "cases", nargs="*", help=f"cases to run, all by default: {', '.join(CASES)}"
+    )
+    parser.add_argument("--records", type=int, help="records per case")
+    parser.add_argument("--save", help="write the results to this json file")
+    parser.add_argument("--compare", help="baseline json file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    unknown = [case for case in args.cases if case not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    report = run(args.cases or list(CASES), args.records)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            slower = regressions(report, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"regression {line}")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
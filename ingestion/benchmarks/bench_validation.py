@@ -0,0 +1,92 @@
+"""
+Compare per-record model validation with the batched and trusted modes.
+
+Run from the ingestion directory:
+    python -m benchmarks.bench_validation
+"""
+
+import time
+import random
+from datetime import datetime
+
+from benchmarks.synthetic import steamspy_payload, store_payload
+from src.apis.steam_metadetails import process_steam_data
+from src.models.pydantic_models import (
+    GameDetails,
+    GameDetailsList,
+    SteamGameMetadata,
+    validate_records,
+)
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name: str, n_records: int, timings: dict):
+    print(f"{n_records} {name} records")
+    for label, seconds in timings.items():
+        print(f"   {label:>22}: {n_records / seconds:>10,.0f} records/s")
+
+
+def main(n_apps: int = 20_000, sample_rate: float = 0.05):
+    rng = random.Random(0)
+    date_added = datetime.now()
+
+    steamspy = [
+        dict(steamspy_payload(rng, appid), date_added=date_added)
+        for appid in range(n_apps)
+    ]
+    report(
+        "steamspy",
+        n_apps,
+        {
+            "per record": best_of(lambda: [GameDetails(**r) for r in steamspy]),
+            "list model": best_of(lambda: GameDetailsList(games=steamspy)),
+            "model_construct": best_of(
+                lambda: [GameDetails.model_construct(**r) for r in steamspy]
+            ),
+            "batched": best_of(lambda: validate_records(GameDetails, steamspy)),
+            f"trusted ({sample_rate:.0%} sample)": best_of(
+                lambda: validate_records(GameDetails, steamspy, sample_rate)
+            ),
+        },
+    )
+
+    # html stripping is benchmarked separately, keep it out of the timings
+    store = [
+        process_steam_data(
+            {
+                **payload,
+                "about_the_game": None,
+                "detailed_description": None,
+                "short_description": None,
+                "supported_languages": None,
+                "reviews": None,
+            },
+            date_added,
+        )
+        for payload in (
+            store_payload(rng, appid)[f"{appid}"]["data"] for appid in range(n_apps)
+        )
+    ]
+    report(
+        "store",
+        n_apps,
+        {
+            "per record": best_of(lambda: [SteamGameMetadata(**r) for r in store]),
+            "batched": best_of(lambda: validate_records(SteamGameMetadata, store)),
+            f"trusted ({sample_rate:.0%} sample)": best_of(
+                lambda: validate_records(SteamGameMetadata, store, sample_rate)
+            ),
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Load test of the fetchers against the stub api server.
+
+Drives SteamSpyMetadataFetcher, SteamStoreMetadata and SteamTop100 against a
+local server, serving synthetic or replayed responses with optional latency,
+server errors and 429s, and reports the requests per second each fetcher
+sustained with the latency percentiles of its requests. The client rate
+limits are lifted so the server is the only throttle, except in record mode
+where the real apis are behind it.
+
+Latency percentiles are read from the http_request_seconds histogram, so
+they are the upper bound of the bucket they fall in.
+
+Run from the ingestion directory:
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --async --latency 0.05 --jitter 0.05
+    python -m benchmarks.load_test --throttle-rate 0.01 --error-rate 0.01
+    python -m benchmarks.load_test --mode record --appids 200
+    python -m benchmarks.load_test --mode replay --async --save load.json
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+from benchmarks.stub_server import (
+    Fixtures,
+    StubServer,
+    add_server_arguments,
+    server_options,
+)
+from src.apis.rate_limiter import host_key
+from src.helpers.metrics import metric_key, metrics
+
+
+def replayed_appids(fixtures: str, route: str, parameter: str) -> list:
+    """Appids of the single app requests recorded for route"""
+    return sorted(
+        int(query[parameter])
+        for query in Fixtures(fixtures).queries(route)
+        if query.get(parameter, "").isdigit()
+    )
+
+
+def steamspy_appids(args) -> list:
+    if args.mode != "replay":
+        return list(range(1, args.appids + 1))
+    return replayed_appids(args.fixtures, "/api.php", "appid")[: args.appids]
+
+
+def store_appids(args) -> list:
+    if args.mode != "replay":
+        return list(range(1, args.appids + 1))
+    return replayed_appids(args.fixtures, "/api/appdetails/", "appids")[: args.appids]
+
+
+def load_steamspy(server_url: str, args):
+    from src.apis.steamspy_gamedetails import (
+        STEAMSPY_RATE_BURST,
+        STEAMSPY_RATE_LIMIT,
+        SteamSpyMetadataFetcher,
+    )
+
+    fetcher = SteamSpyMetadataFetcher(
+        num_workers=args.workers, max_in_flight=args.max_in_flight
+    )
+    fetcher.url = f"{server_url}/api.php"
+    if args.mode == "record":
+        fetcher.rate_limiter.configure(
+            server_url, rate=STEAMSPY_RATE_LIMIT, burst=STEAMSPY_RATE_BURST
+        )
+    appids = steamspy_appids(args)
+    if args.use_async:
+        return len(asyncio.run(fetcher.arun(appids)).games)
+    return len(fetcher.run(appids).games)
+
+
+def load_steam_store(server_url: str, args):
+    from src.apis.steam_metadetails import (
+        STEAM_STORE_RATE_BURST,
+        STEAM_STORE_RATE_LIMIT,
+        SteamStoreMetadata,
+    )
+
+    fetcher = SteamStoreMetadata(
+        num_workers=args.workers, max_in_flight=args.max_in_flight
+    )
+    fetcher.url = server_url
+    if args.mode == "record":
+        fetcher.rate_limiter.configure(
+            server_url, rate=STEAM_STORE_RATE_LIMIT, burst=STEAM_STORE_RATE_BURST
+        )
+    appids = store_appids(args)
+    if args.use_async:
+        return len(asyncio.run(fetcher.arun(appids)).games)
+    return len(fetcher.run(appids).games)
+
+
+def load_top100(server_url: str, args):
+    """The chart is a single request, so it is fetched repeatedly"""
+    from src.apis.steam_top100daily import SteamTop100
+
+    fetcher = SteamTop100()
+    fetcher.url = f"{server_url}/ISteamChartsService/GetMostPlayedGames/v1/"
+    if args.mode == "record":
+        fetcher.rate_limiter.configure(server_url, rate=1)
+    records = 0
+    for _ in range(args.top100_runs):
+        try:
+            records += len(fetcher.run().ranks)
+        except Exception:
+            # run() has nothing to parse once the request gave up, the flow
+            # task retries it, here it shows up in the errors column
+            continue
+    return records
+
+
+FETCHERS = {
+    "steamspy": load_steamspy,
+    "steam_store": load_steam_store,
+    "top100": load_top100,
+}
+
+
+def run_fetcher(name: str, args) -> dict:
+    """Run one fetcher against its own server, so each gets its own host"""
+    metrics.reset()
+    with StubServer(**server_options(args)) as server:
+        start = time.perf_counter()
+        records = FETCHERS[name](server.url, args)
+        seconds = time.perf_counter() - start
+        host = host_key(server.url)
+
+    def counter(metric: str) -> float:
+        return metrics.counters.get(metric_key(metric, {"host": host}), 0)
+
+    latency = metrics.histograms.get(metric_key("http_request_seconds", {"host": host}))
+    requests = counter("http_requests_total")
+    return {
+        "records": records,
+        "seconds": seconds,
+        "requests": requests,
+        "requests_per_second": requests / seconds,
+        "p50": latency.quantile(0.5) if latency else 0.0,
+        "p95": latency.quantile(0.95) if latency else 0.0,
+        "p99": latency.quantile(0.99) if latency else 0.0,
+        "max": latency.max if latency else 0.0,
+        "http_429": counter("http_429_total"),
+        "errors": counter("http_errors_total"),
+        "retries": counter("http_retries_total"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "fetchers",
+        nargs="*",
+        help=f"fetchers to run, all by default: {', '.join(FETCHERS)}",
+    )
+    parser.add_argument("--appids", type=int, default=1000, help="appids per fetcher")
+    parser.add_argument("--top100-runs", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4, help="threads per batch")
+    parser.add_argument("--max-in-flight", type=int, default=100)
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    parser.add_argument("--save", help="write the results to this json file")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    unknown = [name for name in args.fetchers if name not in FETCHERS]
+    if unknown:
+        parser.error(f"unknown fetchers: {', '.join(unknown)}")
+
+    # measure the network path, not the response cache
+    os.environ.pop("HTTP_CACHE_DB", None)
+    # failed requests are counted in the report instead of logged one by one
+    logging.disable(logging.ERROR)
+
+    report = {}
+    for name in args.fetchers or list(FETCHERS):
+        result = report[name] = run_fetcher(name, args)
+        print(
+            f"{name:>12}: {result['records']:>6} records "
+            f"{result['requests']:>6.0f} requests {result['seconds']:7.2f}s "
+            f"{result['requests_per_second']:>9,.0f} req/s "
+            f"p50 {result['p50'] * 1000:6.1f}ms p95 {result['p95'] * 1000:6.1f}ms "
+            f"p99 {result['p99'] * 1000:6.1f}ms max {result['max'] * 1000:6.1f}ms "
+            f"429s {result['http_429']:.0f} errors {result['errors']:.0f} "
+            f"retries {result['retries']:.0f}"
+        )
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
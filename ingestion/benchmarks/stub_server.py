@@ -0,0 +1,380 @@
+"""
+Local stand-in for the SteamSpy, Steam store and Steam charts apis.
+
+By default responses are generated from the synthetic payloads, seeded by
+appid so a given request always returns the same body. In record mode
+requests are forwarded to the real apis and their responses saved as
+fixtures, which replay mode serves back. Latency, server errors and 429s
+can be injected in any mode. The server runs in its own process so serving
+requests does not compete with the code under test for the GIL.
+
+Run a server in the foreground from the ingestion directory:
+    python -m benchmarks.stub_server --port 8000
+    python -m benchmarks.stub_server --mode record --port 8000
+    python -m benchmarks.stub_server --mode replay --latency 0.05 --throttle-rate 0.01
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from benchmarks.synthetic import steamspy_payload, store_payload
+from src.apis.rate_limiter import TokenBucket
+from src.apis.steamspy_gamedetails import STEAMSPY_BASE_URL, STEAMSPY_RATE_LIMIT
+from src.apis.steam_metadetails import STEAM_BASE_SEARCH_URL, STEAM_STORE_RATE_LIMIT
+from src.apis.steam_top100daily import STEAM_TOP_GAMES
+
+# apps per page of the steamspy request=all endpoint
+BULK_PAGE_SIZE: int = 1000
+# where record mode saves responses and replay mode reads them from
+FIXTURES_DIR: str = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def steamspy_response(query: dict):
+    if query.get("request") == "all":
+        page = int(query.get("page", 0))
+        appids = range(page * BULK_PAGE_SIZE + 1, (page + 1) * BULK_PAGE_SIZE + 1)
+        return {
+            f"{appid}": steamspy_payload(random.Random(appid), appid)
+            for appid in appids
+        }
+    appid = int(query["appid"])
+    return steamspy_payload(random.Random(appid), appid)
+
+
+def store_response(query: dict):
+    appids = [int(appid) for appid in query["appids"].split(",")]
+    if query.get("filters") == "price_overview":
+        return {
+            f"{appid}": {
+                "success": True,
+                "data": {
+                    "price_overview": store_payload(random.Random(appid), appid)[
+                        f"{appid}"
+                    ]["data"]["price_overview"]
+                },
+            }
+            for appid in appids
+        }
+    return store_payload(random.Random(appids[0]), appids[0])
+
+
+def top100_response(query: dict):
+    rng = random.Random(0)
+    return {
+        "response": {
+            "rollup_date": 1743465600,
+            "ranks": [
+                {
+                    "rank": rank,
+                    "appid": rank * 10,
+                    "last_week_rank": rng.randint(0, 100),
+                    "peak_in_game": rng.randint(1000, 1000000),
+                }
+                for rank in range(1, 101)
+            ],
+        }
+    }
+
+
+ROUTES = {
+    "/api.php": steamspy_response,
+    "/api/appdetails/": store_response,
+    "/ISteamChartsService/GetMostPlayedGames/v1/": top100_response,
+}
+
+# fixture folder, real url and request rate allowed while recording per route
+UPSTREAMS = {
+    "/api.php": ("steamspy", STEAMSPY_BASE_URL, STEAMSPY_RATE_LIMIT),
+    "/api/appdetails/": (
+        "steam_store",
+        f"{STEAM_BASE_SEARCH_URL}/api/appdetails/",
+        STEAM_STORE_RATE_LIMIT,
+    ),
+    "/ISteamChartsService/GetMostPlayedGames/v1/": ("steam_charts", STEAM_TOP_GAMES, 1),
+}
+
+
+class Fixtures:
+    """Recorded responses on disk, one json file per route and query"""
+
+    def __init__(self, directory: str = FIXTURES_DIR):
+        self.directory = directory
+
+    def path(self, route: str, query: dict) -> str:
+        items = sorted(query.items())
+        key = hashlib.sha1(f"{items}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, UPSTREAMS[route][0], f"{key}.json")
+
+    def load(self, route: str, query: dict):
+        try:
+            with open(self.path(route, query)) as f:
+                return json.load(f)["body"]
+        except FileNotFoundError:
+            return None
+
+    def save(self, route: str, query: dict, body) -> None:
+        path = self.path(route, query)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename so a concurrent replay never reads half a file
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"query": query, "body": body}, f)
+        os.replace(tmp, path)
+
+    def queries(self, route: str) -> list:
+        """Queries recorded for route, to replay the same requests"""
+        directory = os.path.join(self.directory, UPSTREAMS[route][0])
+        if not os.path.isdir(directory):
+            return []
+        queries = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".json"):
+                with open(os.path.join(directory, name)) as f:
+                    queries.append(json.load(f)["query"])
+        return queries
+
+
+class Responses:
+    """
+    Bodies served per mode: generated (synthetic), read from fixtures
+    (replay), or fetched from the real api and saved (record). Record mode
+    paces itself to each api's rate limit and serves fixtures it already has.
+    """
+
+    def __init__(self, mode: str = "synthetic", fixtures: str = FIXTURES_DIR):
+        self.mode = mode
+        self.fixtures = Fixtures(fixtures)
+        self.session = requests.Session()
+        self.buckets = {
+            route: TokenBucket(rate, burst=1)
+            for route, (_, _, rate) in UPSTREAMS.items()
+        }
+
+    def respond(self, route: str, query: dict):
+        """Status, body and headers of the response to route and query"""
+        if self.mode == "synthetic":
+            return 200, ROUTES[route](query), {}
+        body = self.fixtures.load(route, query)
+        if body is not None:
+            return 200, body, {}
+        if self.mode == "replay":
+            return 404, {"error": "no fixture recorded for this request"}, {}
+        time.sleep(self.buckets[route].reserve())
+        response = self.session.get(UPSTREAMS[route][1], params=query, timeout=30)
+        if response.status_code != 200:
+            # pass throttling through so the client backs off as it would
+            headers = {}
+            if "Retry-After" in response.headers:
+                headers["Retry-After"] = response.headers["Retry-After"]
+            return response.status_code, {"error": response.text[:200]}, headers
+        body = response.json()
+        self.fixtures.save(route, query, body)
+        return 200, body, {}
+
+
+class Faults:
+    """
+    Latency, server errors and 429s injected ahead of every response.
+
+    Each request waits latency seconds plus an exponentially distributed
+    jitter with mean jitter, which gives the latency a long tail. A share
+    error_rate of requests fail with a 500 and a share throttle_rate get a
+    429. With rate_limit set, requests over that many per second, past a
+    burst of burst, also get a 429, like the real apis.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        burst: int = 1,
+        retry_after: float = 1.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self._lock:
+            jitter = self.rng.expovariate(1 / self.jitter) if self.jitter else 0.0
+        return self.latency + jitter
+
+    def over_limit(self) -> float:
+        """Seconds until the next request is allowed, 0 if this one is"""
+        if not self.rate_limit:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.updated
+            self.tokens = min(self.tokens + elapsed * self.rate_limit, self.burst)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate_limit
+
+    def fault(self):
+        """Status and headers of an injected failure, or None to respond"""
+        wait = self.over_limit()
+        if wait:
+            return 429, {"Retry-After": f"{wait:.3f}"}
+        with self._lock:
+            draw = self.rng.random()
+        if draw < self.throttle_rate:
+            return 429, {"Retry-After": f"{self.retry_after:g}"}
+        if draw < self.throttle_rate + self.error_rate:
+            return 500, {}
+        return None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, which nagle would delay
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path not in ROUTES:
+            self.send_error(404)
+            return
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        delay = self.server.faults.delay()
+        if delay:
+            time.sleep(delay)
+        fault = self.server.faults.fault()
+        if fault:
+            status, headers = fault
+            self.send_json(status, {"error": "injected"}, headers)
+            return
+        self.send_json(*self.server.responses.respond(url.path, query))
+
+    def send_json(self, status: int, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the async fetchers open max_in_flight connections at once, which the
+    # default backlog of 5 would drop into syn retries of a second or more
+    request_queue_size = 1024
+
+
+def make_server(
+    handler=StubHandler, port=0, mode="synthetic", fixtures=FIXTURES_DIR, **faults
+) -> ThreadingHTTPServer:
+    server = StubHTTPServer(("127.0.0.1", port), handler)
+    server.responses = Responses(mode, fixtures)
+    server.faults = Faults(**faults)
+    return server
+
+
+def serve(handler, ready, **options):
+    server = make_server(handler, **options)
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+class StubServer:
+    """
+    Run a stub api server in a child process for the duration of a with block.
+    Keyword arguments are those of make_server: the port, the mode, the
+    fixtures directory and the Faults to inject.
+
+        with StubServer(latency=0.02, throttle_rate=0.01) as server:
+            fetcher.url = f"{server.url}/api.php"
+    """
+
+    def __init__(self, handler=StubHandler, **options):
+        self.handler = handler
+        self.options = options
+        self.process = None
+        self.url = None
+
+    def __enter__(self):
+        ready = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=serve, args=(self.handler, ready), kwargs=self.options, daemon=True
+        )
+        self.process.start()
+        self.url = f"http://127.0.0.1:{ready.get(timeout=30)}"
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """Server options shared with the load test runner"""
+    parser.add_argument(
+        "--mode", choices=["synthetic", "record", "replay"], default="synthetic"
+    )
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="mean seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests/s")
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--retry-after", type=float, default=1.0, help="seconds")
+
+
+def server_options(args: argparse.Namespace) -> dict:
+    return {
+        "mode": args.mode,
+        "fixtures": args.fixtures,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "throttle_rate": args.throttle_rate,
+        "rate_limit": args.rate_limit,
+        "burst": args.burst,
+        "retry_after": args.retry_after,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8000)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(port=args.port, **server_options(args))
+    print(f"Serving {args.mode} responses on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Synthetic SteamSpy and Steam store payloads for the benchmarks"""
+
+import random
+
+WORDS = (
+    "explore build survive craft battle dungeon open world story co-op "
+    "multiplayer puzzle strategy indie early access sandbox pixel retro"
+).split()
+
+
+def sentence(rng: random.Random, n_words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def store_description(rng: random.Random, n_sections: int = 6) -> str:
+    """HTML shaped like a store about_the_game/detailed_description field"""
+    parts = []
+    for i in range(n_sections):
+        parts.append(f'<h2 class="bb_tag">{sentence(rng, 3)}</h2>')
+        parts.append(
+            f'<p class="bb_paragraph">{sentence(rng)} <strong>{sentence(rng, 4)}</strong>'
+            f" {sentence(rng)} &amp; {sentence(rng, 6)}</p>"
+        )
+        parts.append(
+            f'<img src="https://cdn.example.com/{i}.gif"><br>'
+            '<ul class="bb_ul">'
+            + "".join(f"<li>{sentence(rng, 5)}</li>" for _ in range(4))
+            + "</ul>"
+        )
+    return "".join(parts)
+
+
+def supported_languages(rng: random.Random) -> str:
+    languages = ["English", "French", "German", "Spanish - Spain", "Japanese"]
+    return (
+        ", ".join(f"{lang}<strong>*</strong>" for lang in rng.sample(languages, 3))
+        + "<br><strong>*</strong>languages with full audio support"
+    )
+
+
+TAGS = [f"{word.capitalize()} {other}" for word in WORDS for other in WORDS[:25]]
+
+
+def steamspy_details(rng: random.Random, n_apps: int, n_tags: int = 20):
+    """DataFrame shaped like the raw steamspy table read back from the warehouse"""
+    import pandas as pd
+
+    rows = []
+    for appid in range(10, 10 * n_apps + 10, 10):
+        tags = (
+            None
+            if rng.random() < 0.05
+            else {tag: rng.randint(1, 5000) for tag in rng.sample(TAGS, n_tags)}
+        )
+        rows.append(
+            {
+                "appid": appid,
+                "name": sentence(rng, 3),
+                "developer": rng.choice(WORDS),
+                "publisher": rng.choice(WORDS),
+                "owners": f"{rng.randint(0, 20) * 10000:,} .. {rng.randint(21, 50) * 10000:,}",
+                "price": rng.choice([None, 0, 999, 1999]),
+                "initialprice": rng.choice([None, 0, 999, 1999]),
+                "discount": str(rng.choice([0, 10, 50])),
+                "languages": "English, French",
+                "genre": rng.choice(["Action", "Indie", None]),
+                "tags": tags,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def store_details(rng: random.Random, n_apps: int):
+    """DataFrame shaped like the raw steam store table read back from the warehouse"""
+    import pandas as pd
+
+    def text(n_sentences):
+        return " ".join(sentence(rng) for _ in range(n_sentences))
+
+    rows = []
+    for appid in range(10, 10 * n_apps + 10, 10):
+        rows.append(
+            {
+                "name": sentence(rng, 3),
+                "appid": appid,
+                "date_added": "2025-04-01 00:00:00",
+                "required_age": rng.choice([0, 16, 18]),
+                "is_free": rng.random() < 0.2,
+                "detailed_description": text(30) if rng.random() > 0.02 else None,
+                "about_the_game": text(20),
+                "short_description": text(2),
+                "supported_languages": rng.choice(["English, French", "German", None]),
+                "website": rng.choice(["https://example.com", None]),
+                "header_image": f"https://cdn.example.com/{appid}/header.jpg",
+                "platform__windows": rng.choice([True, True, False, None]),
+                "platform__linux": rng.choice([True, False, None]),
+                "platform__mac": rng.choice([True, False]),
+                "controller_support": rng.choice(["full", None]),
+                "metacritic": rng.randint(0, 100),
+                "recommendations": rng.randint(0, 10000),
+                "achievements_number": rng.randint(0, 100),
+                "release_date": rng.choice(
+                    ["1 Jan, 2020", "Coming soon", "12 Mar, 2024"]
+                ),
+                "reviews": rng.choice([None, "Great game - Some Critic"]),
+                "_dlt_load_id": "1712345678.123",
+                "_dlt_id": f"id{appid}",
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def steamspy_payload(rng: random.Random, appid: int, n_tags: int = 20) -> dict:
+    """Raw response of the steamspy appdetails request"""
+    price = rng.choice(["0", "999", "1999"])
+    return {
+        "appid": appid,
+        "name": sentence(rng, 3),
+        "developer": rng.choice(WORDS),
+        "publisher": rng.choice(WORDS),
+        # ranked apps get a number, the rest an empty string
+        "score_rank": rng.choice(["", rng.randint(1, 100)]),
+        "positive": rng.randint(0, 100000),
+        "negative": rng.randint(0, 10000),
+        "userscore": 0,
+        "owners": f"{rng.randint(0, 20) * 10000:,} .. {rng.randint(21, 50) * 10000:,}",
+        "average_forever": rng.randint(0, 5000),
+        "average_2weeks": rng.randint(0, 500),
+        "median_forever": rng.randint(0, 5000),
+        "median_2weeks": rng.randint(0, 500),
+        "price": price,
+        "initialprice": price,
+        "discount": str(rng.choice([0, 10, 50])),
+        "ccu": rng.randint(0, 100000),
+        "languages": "English, French",
+        "genre": rng.choice(["Action", "Indie", "Action, Indie"]),
+        "tags": (
+            []
+            if rng.random() < 0.05
+            else {tag: rng.randint(1, 5000) for tag in rng.sample(TAGS, n_tags)}
+        ),
+    }
+
+
+def store_payload(rng: random.Random, appid: int) -> dict:
+    """Raw response of the steam store appdetails request"""
+    return {
+        f"{appid}": {
+            "success": True,
+            "data": {
+                "type": "game",
+                "name": sentence(rng, 3),
+                "steam_appid": appid,
+                "required_age": rng.choice([0, 16, "18", "18+"]),
+                "is_free": rng.random() < 0.2,
+                "dlc": [appid + i for i in range(1, rng.randint(1, 5))],
+                "controller_support": rng.choice(["full", "partial"]),
+                "about_the_game": store_description(rng),
+                "detailed_description": store_description(rng),
+                "short_description": sentence(rng, 20),
+                "supported_languages": supported_languages(rng),
+                "reviews": rng.choice(["", "“Great game”<br>- Some Critic"]),
+                "header_image": f"https://cdn.example.com/{appid}/header.jpg",
+                "capsule_image": f"https://cdn.example.com/{appid}/capsule.jpg",
+                "website": rng.choice(["https://example.com", None]),
+                "pc_requirements": rng.choice(
+                    [[], {"minimum": "<strong>Minimum:</strong> 4 GB RAM"}]
+                ),
+                "developers": [rng.choice(WORDS)],
+                "publishers": [rng.choice(WORDS)],
+                "price_overview": {
+                    "currency": "USD",
+                    "initial": 1999,
+                    "final": rng.choice([999, 1999]),
+                    "discount_percent": rng.choice([0, 50]),
+                },
+                "platforms": {
+                    "windows": True,
+                    "mac": rng.random() < 0.3,
+                    "linux": rng.random() < 0.2,
+                },
+                "metacritic": {"score": rng.randint(40, 100)},
+                "categories": [{"id": 2, "description": "Single-player"}],
+                "genres": [{"id": "1", "description": "Action"}],
+                "recommendations": {"total": rng.randint(0, 100000)},
+                "achievements": {"total": rng.randint(0, 100)},
+                "release_date": {"coming_soon": False, "date": "1 Jan, 2020"},
+            },
+        }
+    }
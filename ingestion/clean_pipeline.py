@@ -7,10 +7,17 @@ from prefect.task_runners import ConcurrentTaskRunner
 from src.helpers.steamspy_cleaner import GameDetailsProcessor
 from src.helpers.steamstore_cleaner import SteamStoreProcessor
 from collections import defaultdict
-from src.helpers.pipeline import create_pipeline
+from src.helpers.pipeline import create_pipeline, run_pipeline
+from src.helpers.metrics import metrics
+from src.helpers.progress import ProgressLogger
+from src.helpers.staging import row_ids
 import dlt
+from dlt.destinations.exceptions import DatabaseUndefinedRelation
 import pandas as pd
+import pyarrow as pa
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
 
 # load environment variables
 load_dotenv()
@@ -19,41 +26,196 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# grab newly cleaned data
-fetch_query = """
-SELECT * 
+# fetch and load through arrow instead of per-row python dicts
+CLEAN_ARROW = os.getenv("CLEAN_ARROW", "true").lower() == "true"
+
+# rows per cleaned and loaded chunk, caps the peak memory of a clean run
+CLEAN_CHUNK_SIZE = int(os.getenv("CLEAN_CHUNK_SIZE", 10000))
+
+# processes running the cpu bound cleaners, one per source is enough to keep
+# both branches busy
+CLEAN_WORKERS = int(os.getenv("CLEAN_WORKERS", 2))
+
+# table in the dataset keeping how far each raw table has been cleaned
+CLEAN_WATERMARK_TABLE = os.getenv("CLEAN_WATERMARK_TABLE", "clean_watermarks")
+
+# the rows loaded since the last clean run. loads are picked by commit time,
+# not load id, since loads can commit out of order
+window_query = """
+SELECT *
 FROM  {table}
-WHERE date_added >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 1 HOUR);
+WHERE _dlt_load_id IN (
+    SELECT load_id
+    FROM {loads}
+    WHERE status = 0 AND inserted_at > '{low}' AND inserted_at <= '{high}'
+)
+"""
+
+# one page of the window in (appid, load id) order, as filesystem appends can
+# give an appid rows in several loads
+fetch_query = window_query + """AND (
+    appid > {after_appid}
+    OR (appid = {after_appid} AND _dlt_load_id > '{after_load_id}')
+)
+ORDER BY appid, _dlt_load_id
+LIMIT {chunk_size};
 """
 
+# the filesystem destination appends instead of merging, so take the newest
+watermark_query = """
+SELECT MAX(watermark)
+FROM {watermarks}
+WHERE table_name = '{table_name}';
+"""
+
+latest_load_query = """
+SELECT MAX(inserted_at)
+FROM  {loads}
+WHERE status = 0;
+"""
+
+WATERMARK_FORMAT = "%Y-%m-%d %H:%M:%S.%f+00:00"
+
+
+def format_watermark(inserted_at: datetime) -> str:
+    return inserted_at.astimezone(timezone.utc).strftime(WATERMARK_FORMAT)
+
+
+# the watermark before anything has been cleaned
+FIRST_WATERMARK = format_watermark(datetime.fromtimestamp(0, timezone.utc))
+
+
+def get_watermark(pipeline: dlt.pipeline, table_name: str) -> str:
+    """Commit time of the last load of table_name that has been cleaned"""
+    try:
+        with pipeline.sql_client() as client:
+            res = client.execute_sql(
+                watermark_query.format(
+                    watermarks=client.make_qualified_table_name(CLEAN_WATERMARK_TABLE),
+                    table_name=table_name,
+                )
+            )
+    except DatabaseUndefinedRelation:
+        return FIRST_WATERMARK
+    return res[0][0] if res and res[0][0] else FIRST_WATERMARK
+
+
+def set_watermark(pipeline: dlt.pipeline, table_name: str, watermark: str) -> None:
+    """Store the watermark in the dataset, so any worker resumes from it"""
+    run_pipeline(
+        pipeline,
+        [{"table_name": table_name, "watermark": watermark}],
+        table_name=CLEAN_WATERMARK_TABLE,
+        write_disposition={"disposition": "merge", "strategy": "upsert"},
+        primary_key="table_name",
+        # kept as the string fetch_query compares, not parsed into a timestamp
+        columns={"watermark": {"data_type": "text"}},
+    )
+    logger.info(f"Advanced {table_name} watermark to {watermark}")
+
 
 @task(retries=3, retry_delay_seconds=5)
 async def create_clean_pipeline() -> dlt.pipeline:
-    """Creating the pipeline for cleaning the data from steam"""
+    """
+    Creating the pipeline keeping the clean watermarks.
+
+    It restores its schema from the destination, so a fresh worker finds the
+    watermark table.
+    """
     logger.info("Creating pipeline for cleaning")
     try:
-
-        return create_pipeline(
-            pipeline_name=os.environ["INGEST_PIPELINE"],
+        pipeline = create_pipeline(
+            pipeline_name=f"{os.environ['INGEST_PIPELINE']}_clean",
             dataset_name=os.environ["DATASET"],
         )
+        pipeline.sync_destination()
+        return pipeline
     except Exception as e:
         logger.error(f"Failed to create pipeline: {e}")
         raise
 
 
+def create_load_pipeline(table_name: str) -> dlt.pipeline:
+    """
+    Pipeline loading a single cleaned table.
+
+    Each output table gets its own pipeline, and so its own working dir and
+    state, so the three tables can load concurrently into the same dataset.
+    """
+    return create_pipeline(
+        pipeline_name=f"{os.environ['INGEST_PIPELINE']}_clean_{table_name}",
+        dataset_name=os.environ["DATASET"],
+    )
+
+
+def create_source_pipeline(source: str) -> dlt.pipeline:
+    """
+    Pipeline the ingest flow loads source's raw table with.
+
+    Raw tables are read back through it, as the filesystem destination only
+    finds the tables of the reading pipeline's own schema.
+    """
+    return create_pipeline(
+        pipeline_name=f"{os.environ['INGEST_PIPELINE']}_{source}",
+        dataset_name=os.environ["DATASET"],
+    )
+
+
 @task(retries=3, retry_delay_seconds=5)
-async def fetch_details(pipeline: dlt.pipeline, table_name: str) -> pd.DataFrame:
-    """Fetches data from the pipeline and converts it to a data frame"""
-    logger.info(f"Fetching data from {table_name}")
+async def fetch_latest_load(pipeline: dlt.pipeline) -> str:
+    """Fetches the commit time of the newest load, fixing the upper bound of a run"""
+    with pipeline.sql_client() as client:
+        loads = client.make_qualified_table_name(
+            pipeline.default_schema.loads_table_name
+        )
+        res = client.execute_sql(latest_load_query.format(loads=loads))
+    return format_watermark(res[0][0]) if res and res[0][0] else FIRST_WATERMARK
+
+
+def query_tables(pipeline: dlt.pipeline, client, table_name: str) -> dict:
+    """Qualified names of table_name and the loads table for fetch_query"""
+    return dict(
+        table=client.make_qualified_table_name(table_name),
+        loads=client.make_qualified_table_name(
+            pipeline.default_schema.loads_table_name
+        ),
+    )
+
+
+@task(retries=3, retry_delay_seconds=5)
+async def fetch_details(
+    pipeline: dlt.pipeline,
+    table_name: str,
+    low: str,
+    high: str,
+    after_appid: int = -1,
+    after_load_id: str = "",
+) -> pd.DataFrame:
+    """Fetches the next chunk of data from the pipeline as a data frame"""
+    logger.info(f"Fetching data from {table_name} after appid {after_appid}")
+    params = dict(
+        low=low,
+        high=high,
+        after_appid=after_appid,
+        after_load_id=after_load_id,
+        chunk_size=CLEAN_CHUNK_SIZE,
+    )
+    if CLEAN_ARROW:
+        return fetch_details_arrow(params, pipeline, table_name)
     try:
         with pipeline.sql_client() as client:
-            res = client.execute_sql(fetch_query.format(table=table_name))
+            query = fetch_query.format(
+                **query_tables(pipeline, client, table_name), **params
+            )
+            with client.execute_query(query) as cursor:
+                res = cursor.fetchall()
+                # duckdb returns plain tuples, so name the columns from the cursor
+                columns = [column[0] for column in cursor.description or []]
             if not res:
                 logger.info(f"There was no data returned from {table_name}")
                 return pd.DataFrame()
             # convert rows to dataframe directly
-            df = pd.DataFrame([dict(row) for row in res])
+            df = pd.DataFrame([tuple(row) for row in res], columns=columns)
             logger.info(f"Fetching {len(df)} data sources from {table_name}")
         return df
     except Exception as e:
@@ -61,9 +223,114 @@ async def fetch_details(pipeline: dlt.pipeline, table_name: str) -> pd.DataFrame
         raise
 
 
+def fetch_details_arrow(
+    params: dict, pipeline: dlt.pipeline, table_name: str
+) -> pd.DataFrame:
+    """Fetches data as arrow record batches into an arrow backed data frame"""
+    try:
+        with pipeline.sql_client() as client:
+            query = fetch_query.format(
+                **query_tables(pipeline, client, table_name), **params
+            )
+            with client.execute_query(query) as cursor:
+                table = cursor.arrow()
+        if table is None or table.num_rows == 0:
+            logger.info(f"There was no data returned from {table_name}")
+            return pd.DataFrame()
+        logger.info(f"Fetching {table.num_rows} data sources from {table_name}")
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    except Exception as e:
+        logger.error(f"Error fetching data from {table_name}: {e}")
+        raise
+
+
+def rechunk(batches, size: int):
+    """Regroup a stream of arrow record batches into tables of size rows"""
+    pending, rows = [], 0
+    for batch in batches:
+        pending.append(batch)
+        rows += batch.num_rows
+        while rows >= size:
+            table = pa.Table.from_batches(pending)
+            yield table.slice(0, size)
+            rest = table.slice(size)
+            pending, rows = rest.to_batches(), rest.num_rows
+    if rows:
+        yield pa.Table.from_batches(pending)
+
+
+def iter_window_bigquery(pipeline: dlt.pipeline, table_name: str, low: str, high: str):
+    """
+    Read the window with a single query, streamed through the bigquery storage
+    read api in chunks. Paging with LIMIT would scan the table for every page.
+    """
+    with pipeline.sql_client() as client:
+        query = window_query.format(
+            **query_tables(pipeline, client, table_name), low=low, high=high
+        )
+        with client.execute_query(query) as cursor:
+            rows = cursor.native_cursor.query_job.result(page_size=CLEAN_CHUNK_SIZE)
+            # pages through the rest api when google-cloud-bigquery-storage is
+            # not installed
+            bqstorage_client = client.native_connection._ensure_bqstorage_client()
+            batches = rows.to_arrow_iterable(bqstorage_client=bqstorage_client)
+            for table in rechunk(batches, CLEAN_CHUNK_SIZE):
+                logger.info(f"Fetching {table.num_rows} data sources from {table_name}")
+                if CLEAN_ARROW:
+                    yield table.to_pandas(types_mapper=pd.ArrowDtype)
+                else:
+                    yield table.to_pandas()
+
+
+async def iter_details(pipeline: dlt.pipeline, table_name: str, low: str, high: str):
+    """
+    Iterate the rows of loads committed in (low, high], a chunk at a time.
+
+    Bigquery streams the window from one query, other destinations are paged
+    with LIMIT.
+    """
+    if pipeline.destination.destination_name == "bigquery":
+        chunks = iter_window_bigquery(pipeline, table_name, low, high)
+        while True:
+            with metrics.timer("fetch_seconds", table=table_name):
+                chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            metrics.inc("rows_fetched_total", len(chunk), table=table_name)
+            yield chunk
+    after_appid, after_load_id = -1, ""
+    while True:
+        with metrics.timer("fetch_seconds", table=table_name):
+            chunk = await fetch_details(
+                pipeline, table_name, low, high, after_appid, after_load_id
+            )
+        metrics.inc("rows_fetched_total", len(chunk), table=table_name)
+        if chunk.empty:
+            return
+        # the page ends on its last row in (appid, _dlt_load_id) order
+        after_appid = int(chunk["appid"].iloc[-1])
+        after_load_id = str(chunk["_dlt_load_id"].iloc[-1])
+        yield chunk
+        if len(chunk) < CLEAN_CHUNK_SIZE:
+            return
+
+
+def to_arrow(data: pd.DataFrame, unique_id: str = "appid") -> pa.Table:
+    """
+    Hand cleaned frames to dlt as a single arrow table.
+
+    dlt only adds _dlt_id to the rows it normalizes itself, so arrow tables get
+    the same primary key hash an upserted row dict would be given.
+    """
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    ids = row_ids(table[unique_id].to_pylist(), unique_id)
+    return table.append_column("_dlt_id", pa.array(ids, pa.string()))
+
+
 @task
 async def end() -> None:
-    """Final Logging message"""
+    """Final Logging message and the run's metrics"""
+    metrics.publish("clean")
     logger.info("Steam Data Cleaning workflow completed successfully")
 
 
@@ -76,46 +343,57 @@ async def ingest_clean_data(
     logger.info(f"Ingesting data rows into {table_name}...")
 
     try:
-        if columns is not None:
-            pipeline.run(
-                data,
-                table_name=table_name,
-                write_disposition={"disposition": "merge", "strategy": "upsert"},
-                primary_key=unique_id,
-                columns=columns,
-            )
-        else:
-            pipeline.run(
-                data,
-                table_name=table_name,
-                write_disposition={"disposition": "merge", "strategy": "upsert"},
-                primary_key=unique_id,
-            )
+        with metrics.timer("load_seconds", table=table_name):
+            # loading blocks, keep it off the event loop so loads overlap
+            if columns is not None:
+                await asyncio.to_thread(
+                    run_pipeline,
+                    pipeline,
+                    data,
+                    table_name=table_name,
+                    write_disposition={"disposition": "merge", "strategy": "upsert"},
+                    primary_key=unique_id,
+                    columns=columns,
+                )
+            else:
+                await asyncio.to_thread(
+                    run_pipeline,
+                    pipeline,
+                    data,
+                    table_name=table_name,
+                    write_disposition={"disposition": "merge", "strategy": "upsert"},
+                    primary_key=unique_id,
+                )
         logger.info(f"Successfully ingested data into {table_name}")
     except Exception as e:
         logger.error(f"Error ingesting data to {table_name}: {e}")
         raise
 
 
+def yield_rows(name: str, data: pd.DataFrame, unique_id: str = "appid"):
+    """Yield a cleaned frame as one arrow table or row by row, logging progress"""
+    progress = ProgressLogger(f"Loading {name}", log=logger)
+    if CLEAN_ARROW:
+        yield from progress.track(
+            [to_arrow(data, unique_id)], size=lambda table: table.num_rows
+        )
+        return
+    yield from progress.track(data.to_dict(orient="records"))
+
+
 @dlt.resource(name="steam_spy")
 def yield_steamspy(data):
-    for _data in data.to_dict(orient="records"):
-        logger.info(f"We are logging steam_store {_data}")
-        yield _data
+    yield from yield_rows("steam_spy", data)
 
 
 @dlt.resource(name="steam_store")
 def yield_steamstore(data):
-    for _data in data.to_dict(orient="records"):
-        logger.info(f"We are logging  steam_store {_data}")
-        yield _data
+    yield from yield_rows("steam_store", data)
 
 
 @dlt.resource(name="steam_user_tags")
 def yield_tags(data):
-    for _data in data.to_dict(orient="records"):
-        logger.info(f"We are logging steam_user_tags{_data}")
-        yield _data
+    yield from yield_rows("steam_user_tags", data, unique_id="unique_id")
 
 
 @task
@@ -153,48 +431,100 @@ async def ingest_cleaned_tag_data(pipeline, data, table_name) -> None:
     )
 
 
-async def clean_data_workflow():
-    """Orchestrates the full steam data cleaning process using Prefect"""
-    # Step 1 create the pipeline
-    clean_pipeline = await create_clean_pipeline()
+def clean_steam_spy(data: pd.DataFrame):
+    """
+    Clean a chunk of steam spy details, run in the cleaning process pool.
 
-    # Step 2: Fetch the Data from game details and steam store
-    try:
-        steam_spy_table = os.getenv("STEAMSPY_GAME_DETAILS_TABLE")
-        steam_metadata_table = os.getenv("STEAM_METADATA_TABLE")
-        steam_spy_clean_table = os.getenv("STEAMSPY_GAME_DETAILS_TABLE_CLEAN")
-        steam_store_clean_table = os.getenv("STEAM_STORE_DETAILS_TABLE_CLEAN")
-        steam_user_tag = os.getenv("STEAM_USER_TAG_TABLE")
-        steam_spy_data, steam_store_data = await asyncio.gather(
-            fetch_details(clean_pipeline, steam_spy_table),
-            fetch_details(clean_pipeline, steam_metadata_table),
-        )
+    Returns the metrics recorded while cleaning so the flow can merge them.
+    """
+    metrics.reset()
+    return GameDetailsProcessor().clean(data), metrics.snapshot()
 
-        if not steam_spy_data.empty:
 
-            game_cleaner = GameDetailsProcessor()
-            cleaned_steam_spy_data, cleaned_tags = game_cleaner.clean(steam_spy_data)
+def clean_steam_store(data: pd.DataFrame):
+    """Clean a chunk of steam store details, run in the cleaning process pool"""
+    metrics.reset()
+    return SteamStoreProcessor(data).clean(), metrics.snapshot()
 
-            await ingest_cleaned_steam_spy(
-                clean_pipeline,
+
+async def clean_steam_spy_branch(clean_pipeline, executor) -> None:
+    """Clean and load the new steam spy loads and their user tags"""
+    steam_spy_table = os.getenv("STEAMSPY_GAME_DETAILS_TABLE")
+    steam_spy_clean_table = os.getenv("STEAMSPY_GAME_DETAILS_TABLE_CLEAN")
+    steam_user_tag = os.getenv("STEAM_USER_TAG_TABLE")
+    steam_spy_pipeline = create_load_pipeline(steam_spy_clean_table)
+    tag_pipeline = create_load_pipeline(steam_user_tag)
+    loop = asyncio.get_running_loop()
+
+    source_pipeline = create_source_pipeline("steamspy")
+    low = get_watermark(clean_pipeline, steam_spy_table)
+    high = await fetch_latest_load(source_pipeline)
+    async for steam_spy_data in iter_details(
+        source_pipeline, steam_spy_table, low, high
+    ):
+
+        (cleaned_steam_spy_data, cleaned_tags), cleaned_metrics = (
+            await loop.run_in_executor(executor, clean_steam_spy, steam_spy_data)
+        )
+        metrics.merge(cleaned_metrics)
+
+        await asyncio.gather(
+            ingest_cleaned_steam_spy(
+                steam_spy_pipeline,
                 yield_steamspy(cleaned_steam_spy_data),
                 steam_spy_clean_table,
-            )
-
-            await ingest_cleaned_tag_data(
-                clean_pipeline,
+            ),
+            ingest_cleaned_tag_data(
+                tag_pipeline,
                 yield_tags(cleaned_tags),
                 steam_user_tag,
-            )
+            ),
+        )
+
+    if high > low:
+        set_watermark(clean_pipeline, steam_spy_table, high)
+
+
+async def clean_steam_store_branch(clean_pipeline, executor) -> None:
+    """Clean and load the new steam store loads"""
+    steam_metadata_table = os.getenv("STEAM_METADATA_TABLE")
+    steam_store_clean_table = os.getenv("STEAM_STORE_DETAILS_TABLE_CLEAN")
+    steam_store_pipeline = create_load_pipeline(steam_store_clean_table)
+    loop = asyncio.get_running_loop()
 
-        if not steam_store_data.empty:
+    source_pipeline = create_source_pipeline("steam_store")
+    low = get_watermark(clean_pipeline, steam_metadata_table)
+    high = await fetch_latest_load(source_pipeline)
+    async for steam_store_data in iter_details(
+        source_pipeline, steam_metadata_table, low, high
+    ):
 
-            steam_cleaner = SteamStoreProcessor(steam_store_data)
-            cleaned_steam_store_data = steam_cleaner.clean()
-            await ingest_cleaned_steam_store(
-                clean_pipeline,
-                yield_steamstore(cleaned_steam_store_data),
-                steam_store_clean_table,
+        cleaned_steam_store_data, cleaned_metrics = await loop.run_in_executor(
+            executor, clean_steam_store, steam_store_data
+        )
+        metrics.merge(cleaned_metrics)
+        await ingest_cleaned_steam_store(
+            steam_store_pipeline,
+            yield_steamstore(cleaned_steam_store_data),
+            steam_store_clean_table,
+        )
+
+    if high > low:
+        set_watermark(clean_pipeline, steam_metadata_table, high)
+
+
+async def clean_data_workflow():
+    """Orchestrates the full steam data cleaning process using Prefect"""
+    # Step 1 create the pipeline
+    clean_pipeline = await create_clean_pipeline()
+
+    # Step 2: Clean and load steam spy and steam store side by side, each
+    # fetching its new loads in chunks and cleaning them in the process pool
+    try:
+        with ProcessPoolExecutor(max_workers=CLEAN_WORKERS) as executor:
+            await asyncio.gather(
+                clean_steam_spy_branch(clean_pipeline, executor),
+                clean_steam_store_branch(clean_pipeline, executor),
             )
 
         await end()
@@ -1,11 +1,15 @@
+import os
 from prefect_dbt.cli.commands import DbtCoreOperation
 from prefect import flow
 
+# profiles.yml target, local builds from the duckdb file of DESTINATION=duckdb
+DBT_TARGET: str = os.getenv("DBT_TARGET", "dev")
+
 
 @flow
 def trigger_dbt_flow() -> str:
     result = DbtCoreOperation(
-        commands=["dbt build --vars '{'is_test_run': false}'"],
+        commands=[f"dbt build --target {DBT_TARGET} --vars '{{'is_test_run': false}}'"],
         project_dir="../dbt",
         profiles_dir="~/dbt",
         overwrite_profiles=True,
@@ -4,15 +4,27 @@ from dotenv import load_dotenv
 
 from prefect import flow, task
 from prefect.tasks import task_input_hash
+from prefect.runtime import flow_run
 from datetime import timedelta
+from typing import Optional
 
 from src.apis.steam_top100daily import SteamTop100
-from src.apis.steamspy_gamedetails import SteamSpyMetadataFetcher
+from src.apis.steamspy_gamedetails import (
+    SteamSpyMetadataFetcher,
+    STEAMSPY_BULK_OMITTED,
+)
 from src.apis.steam_metadetails import SteamStoreMetadata
-
-from src.helpers.utils import get_appids
-from src.helpers.pipeline import create_pipeline
+from src.apis.app_hash_store import AppHashStore
+
+from src.helpers.utils import get_last_fetched, get_refresh_dates, get_stored_details
+from src.helpers.scheduler import DEFAULT_BUDGET, RefreshScheduler
+from src.helpers.pipeline import create_pipeline, run_pipeline
+from src.helpers.checkpoint import CheckpointStore
+from src.helpers.metrics import metrics
+from src.helpers.progress import ProgressLogger
+from src.helpers.staging import iter_staged, load_date_today, stage_batches
 import dlt
+from dlt.destinations.exceptions import DatabaseTerminalException
 
 # load environment variables
 load_dotenv()
@@ -21,6 +33,29 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# appids fetched per pipeline.run, so early rows land while later ones are fetched
+LOAD_CHUNK_SIZE = int(os.getenv("LOAD_CHUNK_SIZE", 1000))
+# above this many appids steam spy is refreshed from its paged bulk endpoint
+STEAMSPY_BULK_THRESHOLD = int(os.getenv("STEAMSPY_BULK_THRESHOLD", 5000))
+# processes stripping store html, by default it is parsed inline on the fetch threads
+STEAM_STORE_PARSERS = int(os.getenv("STEAM_STORE_PARSERS", 0))
+# appids refreshed per run in priority order, 0 refreshes everything that is due
+REFRESH_BUDGET = int(os.getenv("REFRESH_BUDGET", DEFAULT_BUDGET))
+
+
+def get_hash_store():
+    """Hash store of the store payloads, None when STEAM_STORE_HASH_DB is unset"""
+    hash_store_path = os.getenv("STEAM_STORE_HASH_DB")
+    return AppHashStore(hash_store_path) if hash_store_path else None
+
+
+def get_checkpoint(source: str):
+    """Checkpoint for this flow run, so task retries resume instead of restarting"""
+    checkpoint_path = os.getenv("CHECKPOINT_DB")
+    if not checkpoint_path:
+        return None
+    return CheckpointStore(checkpoint_path).for_run(flow_run.id, source)
+
 
 @task(
     retries=3,
@@ -35,30 +70,165 @@ def fetch_top_played_100() -> list:
     return daily_top_100_data.model_dump()["ranks"]
 
 
+@dlt.resource(
+    write_disposition={"disposition": "merge", "strategy": "upsert"},
+    primary_key="appid",
+    columns={"tags": {"data_type": "json"}},
+)
+def steamspy_game_details(
+    appids, bulk=False, checkpoint=None, load_date=None, stored_details=None
+):
+    """
+    Stream validated steam spy records to dlt batch by batch, or with a
+    load_date the records staged that day instead of fetching them.
+    """
+    table_name = os.environ["STEAMSPY_GAME_DETAILS_TABLE"]
+    if load_date:
+        yield from iter_staged("steamspy", table_name, load_date)
+        return
+    game_details = SteamSpyMetadataFetcher(checkpoint=checkpoint)
+    if bulk:
+        batches = game_details.iter_bulk_batches(appids, stored_details)
+    else:
+        batches = game_details.iter_batches(appids)
+    yield from stage_batches(
+        "steamspy",
+        ProgressLogger("Fetching steam spy", log=logger).track(batches, size=len),
+        table_name,
+    )
+
+
+@dlt.resource(
+    write_disposition={"disposition": "merge", "strategy": "upsert"},
+    primary_key="appid",
+)
+def steam_store_metadata(appids, checkpoint=None, load_date=None, hash_store=None):
+    """
+    Stream validated steam store records to dlt batch by batch, or with a
+    load_date the records staged that day instead of fetching them.
+    """
+    table_name = os.environ["STEAM_METADATA_TABLE"]
+    if load_date:
+        yield from iter_staged("steam_store", table_name, load_date)
+        return
+    steam_metadata_client = SteamStoreMetadata(
+        hash_store=hash_store,
+        checkpoint=checkpoint,
+        num_parsers=STEAM_STORE_PARSERS,
+    )
+    yield from stage_batches(
+        "steam_store",
+        ProgressLogger("Fetching steam store", log=logger).track(
+            steam_metadata_client.iter_batches(appids), size=len
+        ),
+        table_name,
+    )
+
+
 @task(retries=3, retry_delay_seconds=10)
-def fetch_steamspy_game_details(appids) -> list:
-    """Function to pull data from steam spy"""
-    logger.info("Fetching steam_spy details")
-    game_details = SteamSpyMetadataFetcher()
-    game_details_data = game_details.run(appids)
-    return game_details_data
+@metrics.timed("task_seconds", task="fetch_steamspy_game_details")
+def fetch_steamspy_game_details(ingestion_pipeline, appids):
+    """Function to pull data from steam spy and load it as it arrives"""
+    logger.info("Fetching and ingesting steam_spy details...")
+    checkpoint = get_checkpoint("steamspy")
+    if len(appids) >= STEAMSPY_BULK_THRESHOLD:
+        logger.info(f"Using bulk pages for {len(appids)} appids")
+        # the upsert replaces whole rows, so the fields the pages omit are
+        # carried over from the loaded rows until they are due a refetch
+        table_name = os.environ["STEAMSPY_GAME_DETAILS_TABLE"]
+        try:
+            stored_details = get_stored_details(
+                ingestion_pipeline,
+                table_name,
+                appids,
+                STEAMSPY_BULK_OMITTED + ("details_date",),
+                json_columns=("tags",),
+            )
+        except DatabaseTerminalException:
+            # tables loaded before details_date was kept, every app is due
+            logger.warning(f"{table_name} has no details_date, refetching details")
+            stored_details = {}
+        run_pipeline(
+            ingestion_pipeline,
+            steamspy_game_details(
+                appids,
+                bulk=True,
+                checkpoint=checkpoint,
+                stored_details=stored_details,
+            ),
+            table_name=os.environ["STEAMSPY_GAME_DETAILS_TABLE"],
+        )
+    else:
+        for i in range(0, len(appids), LOAD_CHUNK_SIZE):
+            run_pipeline(
+                ingestion_pipeline,
+                steamspy_game_details(
+                    appids[i : i + LOAD_CHUNK_SIZE], checkpoint=checkpoint
+                ),
+                table_name=os.environ["STEAMSPY_GAME_DETAILS_TABLE"],
+            )
+    if checkpoint:
+        checkpoint.clear()
 
 
 @task(retries=3, retry_delay_seconds=10)
-def fetch_steam_store_data(appids) -> list:
-    """Function to pull data from steam store"""
-    logger.info("Fetching top played games in the last 24 hours")
-    steam_metadata_client = SteamStoreMetadata()
-    metadata_data = steam_metadata_client.run(appids)
-    return metadata_data
+@metrics.timed("task_seconds", task="fetch_steam_store_data")
+def fetch_steam_store_data(ingestion_pipeline, appids):
+    """Function to pull data from steam store and load it as it arrives"""
+    logger.info("Fetching and ingesting steam store details...")
+    checkpoint = get_checkpoint("steam_store")
+    hash_store = get_hash_store()
+    for i in range(0, len(appids), LOAD_CHUNK_SIZE):
+        run_pipeline(
+            ingestion_pipeline,
+            steam_store_metadata(
+                appids[i : i + LOAD_CHUNK_SIZE],
+                checkpoint=checkpoint,
+                hash_store=hash_store,
+            ),
+            table_name=os.environ["STEAM_METADATA_TABLE"],
+        )
+        # only loaded apps may be skipped as unchanged on the next run
+        if hash_store:
+            hash_store.commit()
+    if checkpoint:
+        checkpoint.clear()
+
+
+@task(retries=3, retry_delay_seconds=10)
+def reload_steamspy_game_details(ingestion_pipeline, load_date: str):
+    """Load the steam spy records staged on load_date again, without fetching"""
+    logger.info(f"Reloading steam_spy details staged on {load_date}...")
+    run_pipeline(
+        ingestion_pipeline,
+        steamspy_game_details(None, load_date=load_date),
+        table_name=os.environ["STEAMSPY_GAME_DETAILS_TABLE"],
+    )
+
+
+@task(retries=3, retry_delay_seconds=10)
+def reload_steam_store_data(ingestion_pipeline, load_date: str):
+    """Load the steam store records staged on load_date again, without fetching"""
+    logger.info(f"Reloading steam store details staged on {load_date}...")
+    run_pipeline(
+        ingestion_pipeline,
+        steam_store_metadata(None, load_date=load_date),
+        table_name=os.environ["STEAM_METADATA_TABLE"],
+    )
 
 
 @task
-def create_ingestion_pipeline() -> dlt.pipeline:
-    """Creating the pipeline for ingesting the data from steam"""
-    logger.info("Creating pipeline for ingestion")
+def create_ingestion_pipeline(source: str = None) -> dlt.pipeline:
+    """
+    Creating the pipeline for ingesting the data from steam.
+
+    Sources loaded concurrently each get their own pipeline, and with it their
+    own working dir and state, while still loading into the same dataset.
+    """
+    logger.info(f"Creating pipeline for ingestion {source or ''}")
+    pipeline_name = os.environ["INGEST_PIPELINE"]
     return create_pipeline(
-        pipeline_name=os.environ["INGEST_PIPELINE"],
+        pipeline_name=f"{pipeline_name}_{source}" if source else pipeline_name,
         dataset_name=os.environ["DATASET"],
     )
 
@@ -70,33 +240,56 @@ def get_ingestion_appids(data) -> list:
 
 
 @task
+@metrics.timed("task_seconds", task="ingest_daily_100")
 def ingest_daily_100(pipeline: dlt.pipeline, top_100_data: list):
     """Ingest top 100 games into the pipeline."""
     logger.info("Ingesting Top 100 data into pipeline...")
 
-    pipeline.run(
+    run_pipeline(
+        pipeline,
         top_100_data,
         table_name=os.environ["STEAM_TOP_100_TABLE"],
     )
 
 
 @task
-def determine_appids(pipeline, appids: list) -> list:
-    """Determine which app IDs need to be pulled based on existing data in BigQuery."""
-    dataset_tables = pipeline.dataset().row_counts().df()["table_name"].values
-
-    if (
-        os.environ["STEAM_METADATA_TABLE"] in dataset_tables
-        and os.environ["STEAMSPY_GAME_DETAILS_TABLE"] in dataset_tables
-    ):
-        steamspy_appids = get_appids(
-            pipeline, os.environ["STEAMSPY_GAME_DETAILS_TABLE"], appids
+def determine_appids(
+    steamspy_pipeline, steam_store_pipeline, appids: list, ranks: list
+) -> list:
+    """
+    Determine which app IDs need to be pulled based on existing data in BigQuery.
+
+    Each table is read through the pipeline that loads it, as only that
+    pipeline's schema knows the table.
+    """
+    steamspy_fetched = get_last_fetched(
+        steamspy_pipeline, os.environ["STEAMSPY_GAME_DETAILS_TABLE"], appids
+    )
+    steam_store_fetched = get_last_fetched(
+        steam_store_pipeline, os.environ["STEAM_METADATA_TABLE"], appids
+    )
+
+    if steamspy_fetched is not None and steam_store_fetched is not None:
+        hash_store = get_hash_store()
+        if hash_store:
+            # apps whose full payload came back unchanged are not loaded again,
+            # so they count as fetched when their payload was last checked
+            checked = hash_store.checked_dates(steam_store_fetched)
+            steam_store_fetched = {
+                appid: max(date, checked.get(appid, date))
+                for appid, date in steam_store_fetched.items()
+            }
+        last_fetched = get_refresh_dates(
+            [steamspy_fetched, steam_store_fetched], appids
         )
-        steamstore_appids = get_appids(
-            pipeline, os.environ["STEAM_METADATA_TABLE"], appids
+        price_changes = (
+            hash_store.price_changes(set(appids) | set(last_fetched))
+            if hash_store
+            else {}
         )
 
-        pull_appids = list(set(steamspy_appids + steamstore_appids))
+        scheduler = RefreshScheduler(budget=REFRESH_BUDGET)
+        pull_appids = scheduler.schedule(ranks, last_fetched, price_changes)
         logger.info(f"Found {len(pull_appids)} app IDs requiring an update.")
     else:
         logger.info("No existing metadata found. Pulling all app IDs.")
@@ -106,31 +299,11 @@ def determine_appids(pipeline, appids: list) -> list:
 
 @task
 def end() -> None:
-    """Final Logging message"""
+    """Final Logging message and the run's metrics"""
+    metrics.publish("ingest")
     logger.info("Steam Data ingestion workflow completed successfully")
 
 
-@task
-def ingest_data(ingestion_pipeline, game_details_data, metadata_data):
-    """Ingesting data into big query"""
-    logger.info("Ingesting SteamSpy data into Big Query...")
-    ingestion_pipeline.run(
-        game_details_data.games,
-        table_name=os.environ["STEAMSPY_GAME_DETAILS_TABLE"],
-        write_disposition={"disposition": "merge", "strategy": "upsert"},
-        primary_key="appid",
-        columns={"tags": {"data_type": "json"}},
-    )
-
-    logger.info("Ingesting SteamStore data into Big Query...")
-    ingestion_pipeline.run(
-        metadata_data.games,
-        table_name=os.environ["STEAM_METADATA_TABLE"],
-        write_disposition={"disposition": "merge", "strategy": "upsert"},
-        primary_key="appid",
-    )
-
-
 @flow
 def stream_data_workflow():
     """Orchestratees the full steam data ingestion process using Prefect"""
@@ -146,21 +319,41 @@ def stream_data_workflow():
     # Step 4 extract the appids
     appids = get_ingestion_appids(daily_top_played_games)
 
-    # Step 5: Determine which appids to use
-    pull_appids = determine_appids(ingestion_pipeline, appids)
+    # Step 5: Determine which appids to use, through the pipelines that load
+    # each source
+    steamspy_pipeline = create_ingestion_pipeline("steamspy")
+    steam_store_pipeline = create_ingestion_pipeline("steam_store")
+    pull_appids = determine_appids(
+        steamspy_pipeline, steam_store_pipeline, appids, daily_top_played_games
+    )
 
     if pull_appids:
-        # Step 6: Fetch steam spy
-        game_details_data = fetch_steamspy_game_details(pull_appids)
-        # Step 7 fetch the steam store details
-        metadata_data = fetch_steam_store_data(pull_appids)
-        #     # Step 8 ingest the data
-        ingest_data(ingestion_pipeline, game_details_data, metadata_data)
+        # Step 6: Fetch and ingest steam spy and the steam store side by side,
+        # they hit different hosts with independent rate limits
+        steamspy = fetch_steamspy_game_details.submit(steamspy_pipeline, pull_appids)
+        steam_store = fetch_steam_store_data.submit(steam_store_pipeline, pull_appids)
+        # Step 7: wait for both sources, raising if either failed
+        steamspy.result()
+        steam_store.result()
         end()
 
     else:
         end()
 
 
+@flow
+def reload_staged_workflow(load_date: Optional[str] = None):
+    """
+    Load the steam spy and steam store records staged on load_date, today by
+    default, without fetching them again, e.g. after a failed load or a
+    dropped table.
+    """
+    load_date = load_date or load_date_today()
+    steamspy_pipeline = create_ingestion_pipeline("steamspy")
+    steam_store_pipeline = create_ingestion_pipeline("steam_store")
+    reload_steamspy_game_details(steamspy_pipeline, load_date)
+    reload_steam_store_data(steam_store_pipeline, load_date)
+
+
 if __name__ == "__main__":
     stream_data_workflow()
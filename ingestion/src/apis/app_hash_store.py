@@ -0,0 +1,139 @@
+import json
+import time
+import sqlite3
+import threading
+import hashlib
+from datetime import datetime
+
+
+def content_hash(data) -> str:
+    """Stable hash of a json payload"""
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class AppHashStore:
+    """
+    SQLite store of the last seen content and price hashes per appid.
+
+    The store api does not send ETag or Last-Modified headers, so unchanged
+    apps are detected by hashing the payloads instead. Hashes seen during a
+    fetch are only held until commit is called once the records are loaded,
+    so a failed load does not mark its apps as unchanged.
+    """
+
+    def __init__(self, path: str, max_age_days: float = 7):
+        self.path = path
+        self.max_age = max_age_days * 24 * 60 * 60
+        # appid to the hashes seen since the last commit, fetch threads share it
+        self.pending = {}
+        self.lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS apps (appid INTEGER PRIMARY KEY, "
+                "content_hash TEXT, price_hash TEXT, fetched_at REAL, "
+                "checked_at REAL, price_changes INTEGER DEFAULT 0)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    def _stage(self, app_id: int, **values):
+        with self.lock:
+            self.pending.setdefault(app_id, {}).update(values)
+
+    def unchanged_prices(self, prices: dict) -> set:
+        """
+        Stage the latest price hashes and return the appids whose price is
+        unchanged and whose full payload was fetched within max_age.
+
+        A matching price only defers the full fetch, the rest of the payload is
+        not checked, so skipped apps are not marked as checked and max_age
+        should not exceed the freshness window.
+        """
+        now = time.time()
+        unchanged = set()
+        with self._connect() as conn:
+            for app_id, price in prices.items():
+                price_hash = content_hash(price)
+                row = conn.execute(
+                    "SELECT price_hash, fetched_at FROM apps WHERE appid = ?",
+                    (app_id,),
+                ).fetchone()
+                if row is None:
+                    self._stage(app_id, price_hash=price_hash, price_changed=0)
+                elif row[0] != price_hash:
+                    self._stage(app_id, price_hash=price_hash, price_changed=1)
+                elif row[1] and now - row[1] < self.max_age:
+                    unchanged.add(app_id)
+        return unchanged
+
+    def content_changed(self, app_id: int, data) -> bool:
+        """Stage the hash of a full payload, returning False if it is unchanged"""
+        new_hash = content_hash(data)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT content_hash FROM apps WHERE appid = ?", (app_id,)
+            ).fetchone()
+        now = time.time()
+        self._stage(app_id, content_hash=new_hash, fetched_at=now, checked_at=now)
+        return row is None or row[0] != new_hash
+
+    def commit(self):
+        """
+        Save the hashes staged since the last commit. Apps whose full payload
+        never came back keep their old price hash, so they are fetched again.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        rows = [
+            (
+                app_id,
+                values.get("content_hash"),
+                values.get("price_hash"),
+                values.get("fetched_at"),
+                values["checked_at"],
+                values.get("price_changed", 0),
+            )
+            for app_id, values in pending.items()
+            if "checked_at" in values
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO apps (appid, content_hash, price_hash, fetched_at, "
+                "checked_at, price_changes) VALUES (?, ?, ?, ?, ?, 0) "
+                "ON CONFLICT(appid) DO UPDATE SET "
+                "content_hash = COALESCE(excluded.content_hash, content_hash), "
+                "price_hash = COALESCE(excluded.price_hash, price_hash), "
+                "fetched_at = COALESCE(excluded.fetched_at, fetched_at), "
+                "checked_at = excluded.checked_at, "
+                "price_changes = price_changes + ?",
+                rows,
+            )
+
+    def price_changes(self, appids) -> dict:
+        """Number of price changes seen so far for each known appid"""
+        appids = [int(appid) for appid in appids]
+        if not appids:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT appid, price_changes FROM apps WHERE appid IN "
+                f"({', '.join('?' * len(appids))})",
+                appids,
+            ).fetchall()
+        return dict(rows)
+
+    def checked_dates(self, appids) -> dict:
+        """When the full payload of each known appid was last fetched"""
+        appids = [int(appid) for appid in appids]
+        if not appids:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT appid, checked_at FROM apps WHERE checked_at IS NOT NULL "
+                f"AND appid IN ({', '.join('?' * len(appids))})",
+                appids,
+            ).fetchall()
+        return {appid: datetime.fromtimestamp(checked_at) for appid, checked_at in rows}
@@ -1,12 +1,41 @@
 import requests
+import httpx
+import asyncio
 import time
 import logging
+import os
+from src.apis.rate_limiter import get_rate_limiter, host_key, parse_retry_after
+from src.helpers.metrics import metrics
+from src.models.pydantic_models import validate_records
+from src.apis.response_cache import get_response_cache
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+HEADERS = {"User-Agent": "YourCustomUserAgent/1.0", "DNT": "1"}
+# share of each batch validated in trusted mode, 0 validates every record
+VALIDATION_SAMPLE_RATE: float = float(os.getenv("VALIDATION_SAMPLE_RATE", 0))
 
 
 class ApiClient:
+    # label of the fetcher in the metrics and the model its batches validate to
+    source = "api"
+    model = None
 
-    def __init__(self):
+    def __init__(self, max_in_flight=100, http2=True, timeout=30):
         self.session = requests.Session()  # reuse TCP connections
+        self.session.headers.update(HEADERS)
+        self.max_in_flight = max_in_flight
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.timeout = timeout
+        self.rate_limiter = get_rate_limiter()
+        self.cache = get_response_cache()
+        self.checkpoint = None
+        self.sample_rate = VALIDATION_SAMPLE_RATE
         self.logger = logging.getLogger(__name__)
 
     def get_request(
@@ -18,25 +47,57 @@ class ApiClient:
         wait_time_multiplier=4,
     ):
         """Send a GET request with retries and exponential backoff."""
+        host = host_key(url)
+        if self.cache:
+            cached = self.cache.get(url, parameters)
+            if cached is not None:
+                metrics.inc("http_cache_hits_total", host=host)
+                return cached
+            metrics.inc("http_cache_misses_total", host=host)
         attempts = 0
-        headers = {"User-Agent": "YourCustomUserAgent/1.0", "DNT": "1"}
         while attempts < max_retries:
+            wait = self.rate_limiter.reserve(url)
+            metrics.inc("rate_limit_wait_seconds_total", wait, host=host)
+            time.sleep(wait)
             try:
-                response = requests.get(url=url, headers=headers, params=parameters)
+                metrics.inc("http_requests_total", host=host)
+                with metrics.timer("http_request_seconds", host=host):
+                    response = self.session.get(
+                        url=url, params=parameters, timeout=self.timeout
+                    )
                 if response.status_code == 200:
-                    return response.json()
+                    self.rate_limiter.reward(url)
+                    metrics.inc(
+                        "http_bytes_downloaded_total", len(response.content), host=host
+                    )
+                    data = response.json()
+                    if self.cache:
+                        self.cache.set(url, parameters, response.text)
+                    return data
                 elif response.status_code == 429:  # too many requests
-                    retry_after = response.headers.get("Retry-After", wait_time)
-                    time.sleep(retry_after)
+                    retry_after = parse_retry_after(
+                        response.headers.get("Retry-After"), wait_time
+                    )
+                    metrics.inc("http_429_total", host=host)
+                    # the limiter holds back every caller on this host, the
+                    # next reserve waits out retry_after without any backoff
+                    if not self.rate_limiter.penalise(url, retry_after):
+                        time.sleep(retry_after)
+                    attempts += 1
+                    metrics.inc("http_retries_total", host=host)
+                    continue
                 else:
+                    metrics.inc("http_errors_total", host=host)
                     self.logger.error(
                         f"Request failed with status {response.status_code}: {response.text}"
                     )
                     return None
 
             except Exception as e:
+                metrics.inc("http_errors_total", host=host)
                 self.logger.error(f"Request failed with status {e}")
             attempts += 1
+            metrics.inc("http_retries_total", host=host)
             sleep_time = min(
                 wait_time * (wait_time_multiplier ** (attempts - 1)), 60
             )  # Cap sleep at 60 sec
@@ -44,3 +105,141 @@ class ApiClient:
             time.sleep(sleep_time)
 
         return None
+
+    def save_checkpoint(self, app_id, data):
+        """Record a raw payload so a resumed run does not fetch it again"""
+        if self.checkpoint and data:
+            self.checkpoint.save(app_id, data)
+
+    def resume(self, app_ids):
+        """Split app_ids into payloads already checkpointed and appids left to fetch"""
+        if not self.checkpoint:
+            return {}, app_ids
+        checkpointed = self.checkpoint.load()
+        done = {
+            app_id: checkpointed[app_id] for app_id in app_ids if app_id in checkpointed
+        }
+        return done, [app_id for app_id in app_ids if app_id not in done]
+
+    def iter_replayed(self, done: dict):
+        """Yield validated batches rebuilt from checkpointed payloads"""
+        app_ids = list(done)
+        for i in range(0, len(app_ids), self.batch_size):
+            results = [
+                self.handle_response(app_id, done[app_id])
+                for app_id in app_ids[i : i + self.batch_size]
+            ]
+            batch_data = self.keep_fetched(results)
+            if batch_data:
+                yield self.validate_batch(batch_data)
+
+    def keep_fetched(self, results: list) -> list:
+        """Drop failed or skipped fetches, counting both per source"""
+        batch_data = [result for result in results if result]
+        metrics.inc("rows_fetched_total", len(batch_data), source=self.source)
+        metrics.inc(
+            "rows_dropped_total", len(results) - len(batch_data), source=self.source
+        )
+        return batch_data
+
+    def validate_batch(self, batch_data):
+        with metrics.timer("validate_seconds", source=self.source):
+            records = validate_records(self.model, batch_data, self.sample_rate)
+        metrics.inc("rows_validated_total", len(records), source=self.source)
+        return records
+
+    def async_client(self) -> httpx.AsyncClient:
+        """Create an async client with a keep-alive connection pool sized to max_in_flight."""
+        limits = httpx.Limits(
+            max_connections=self.max_in_flight,
+            max_keepalive_connections=self.max_in_flight,
+        )
+        return httpx.AsyncClient(
+            headers=HEADERS, limits=limits, http2=self.http2, timeout=self.timeout
+        )
+
+    async def async_get_request(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        parameters=None,
+        max_retries=5,
+        wait_time=5,
+        wait_time_multiplier=4,
+    ):
+        """
+        Async version of get_request sharing the pooled connections of client.
+
+        The response cache and a RATE_LIMIT_DB limiter are SQLite backed, so
+        they are called from a worker thread to keep the event loop free.
+        """
+        host = host_key(url)
+        if self.cache:
+            cached = await asyncio.to_thread(self.cache.get, url, parameters)
+            if cached is not None:
+                metrics.inc("http_cache_hits_total", host=host)
+                return cached
+            metrics.inc("http_cache_misses_total", host=host)
+        attempts = 0
+        while attempts < max_retries:
+            wait = await asyncio.to_thread(self.rate_limiter.reserve, url)
+            metrics.inc("rate_limit_wait_seconds_total", wait, host=host)
+            await asyncio.sleep(wait)
+            try:
+                metrics.inc("http_requests_total", host=host)
+                with metrics.timer("http_request_seconds", host=host):
+                    response = await client.get(url, params=parameters)
+                if response.status_code == 200:
+                    await asyncio.to_thread(self.rate_limiter.reward, url)
+                    metrics.inc(
+                        "http_bytes_downloaded_total", len(response.content), host=host
+                    )
+                    data = response.json()
+                    if self.cache:
+                        await asyncio.to_thread(
+                            self.cache.set, url, parameters, response.text
+                        )
+                    return data
+                elif response.status_code == 429:  # too many requests
+                    retry_after = parse_retry_after(
+                        response.headers.get("Retry-After"), wait_time
+                    )
+                    metrics.inc("http_429_total", host=host)
+                    # the limiter holds back every caller on this host, the
+                    # next reserve waits out retry_after without any backoff
+                    if not await asyncio.to_thread(
+                        self.rate_limiter.penalise, url, retry_after
+                    ):
+                        await asyncio.sleep(retry_after)
+                    attempts += 1
+                    metrics.inc("http_retries_total", host=host)
+                    continue
+                else:
+                    metrics.inc("http_errors_total", host=host)
+                    self.logger.error(
+                        f"Request failed with status {response.status_code}: {response.text}"
+                    )
+                    return None
+
+            except Exception as e:
+                metrics.inc("http_errors_total", host=host)
+                self.logger.error(f"Request failed with status {e}")
+            attempts += 1
+            metrics.inc("http_retries_total", host=host)
+            sleep_time = min(
+                wait_time * (wait_time_multiplier ** (attempts - 1)), 60
+            )  # Cap sleep at 60 sec
+            self.logger.info(f"Retrying in {sleep_time} seconds...")
+            await asyncio.sleep(sleep_time)
+
+        return None
+
+    async def gather_bounded(self, fetch, items):
+        """Run fetch(item) for every item with at most max_in_flight requests in flight."""
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def bounded(item):
+            async with semaphore:
+                return await fetch(item)
+
+        return await asyncio.gather(*(bounded(item) for item in items))
@@ -0,0 +1,194 @@
+import os
+import time
+import sqlite3
+import threading
+import logging
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# multiplicative slowdown applied on a 429 and additive recovery per success
+SLOWDOWN_FACTOR = 0.5
+RECOVERY_STEP = 0.05
+MIN_RATE_FRACTION = 0.05
+
+
+def host_key(url: str) -> str:
+    """Rate limits are shared by every url on the same host"""
+    return urlparse(url).netloc or url
+
+
+def parse_retry_after(value, default: float) -> float:
+    """Retry-After is either a number of seconds or an HTTP date"""
+    if value is None:
+        return float(default)
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return float(default)
+
+
+class TokenBucket:
+    """
+    Token bucket for a single host.
+
+    reserve() always takes a token and returns how long the caller has to wait
+    before using it, so the same bucket can pace threads and coroutines. The
+    current rate is halved on every 429 and slowly recovers towards the
+    configured rate on success.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = rate * MIN_RATE_FRACTION
+        self._state = {"tokens": float(burst), "updated": time.time(), "rate": rate}
+        self._lock = threading.Lock()
+
+    def _transact(self, update):
+        with self._lock:
+            return update(self._state)
+
+    def _refill(self, state, now):
+        elapsed = max(now - state["updated"], 0.0)
+        state["tokens"] = min(state["tokens"] + elapsed * state["rate"], self.burst)
+        state["updated"] = now
+
+    def reserve(self) -> float:
+        """Take a token, returning the seconds to wait before it is valid"""
+
+        def update(state):
+            self._refill(state, time.time())
+            state["tokens"] -= 1
+            return max(-state["tokens"] / state["rate"], 0.0)
+
+        return self._transact(update)
+
+    def penalise(self, retry_after: float = 0.0) -> None:
+        """Slow down after a 429 and hold every caller back for retry_after"""
+
+        def update(state):
+            self._refill(state, time.time())
+            state["rate"] = max(state["rate"] * SLOWDOWN_FACTOR, self.min_rate)
+            state["tokens"] = min(state["tokens"], -retry_after * state["rate"])
+            return state["rate"]
+
+        rate = self._transact(update)
+        logger.warning(f"Throttled, slowing down to {rate:.3f} requests/sec")
+
+    def reward(self) -> None:
+        """Recover towards the configured rate after a successful request"""
+
+        def update(state):
+            if state["rate"] < self.rate:
+                self._refill(state, time.time())
+                state["rate"] = min(
+                    state["rate"] + self.rate * RECOVERY_STEP, self.rate
+                )
+
+        self._transact(update)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket whose state lives in a SQLite file, so every process pointing
+    at the same file draws from one budget per host.
+    """
+
+    def __init__(self, rate: float, burst: int, path: str, key: str):
+        super().__init__(rate, burst)
+        self.path = path
+        self.key = key
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(host TEXT PRIMARY KEY, tokens REAL, updated REAL, rate REAL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def _transact(self, update):
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock so the read-modify-write is atomic
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated, rate FROM buckets WHERE host = ?", (self.key,)
+            ).fetchone()
+            if row:
+                state = {"tokens": row[0], "updated": row[1], "rate": row[2]}
+            else:
+                state = dict(self._state)
+            result = update(state)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)",
+                (self.key, state["tokens"], state["updated"], state["rate"]),
+            )
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+class RateLimiter:
+    """
+    Registry of token buckets keyed by host.
+
+    Set RATE_LIMIT_DB to a file path to share the buckets between processes,
+    otherwise they are shared by every client in the current process.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def configure(self, url: str, rate: float, burst: int = 1) -> None:
+        """Register the budget for the host of url, keeping an existing one"""
+        key = host_key(url)
+        with self._lock:
+            if key in self.buckets:
+                return
+            if self.path:
+                self.buckets[key] = SharedTokenBucket(rate, burst, self.path, key)
+            else:
+                self.buckets[key] = TokenBucket(rate, burst)
+
+    def reserve(self, url: str) -> float:
+        bucket = self.buckets.get(host_key(url))
+        return bucket.reserve() if bucket else 0.0
+
+    def penalise(self, url: str, retry_after: float = 0.0) -> bool:
+        """Hold back url's host, False when no bucket paces it"""
+        bucket = self.buckets.get(host_key(url))
+        if not bucket:
+            return False
+        bucket.penalise(retry_after)
+        return True
+
+    def reward(self, url: str) -> None:
+        bucket = self.buckets.get(host_key(url))
+        if bucket:
+            bucket.reward()
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process wide rate limiter shared by every ApiClient"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(os.getenv("RATE_LIMIT_DB"))
+    return _rate_limiter
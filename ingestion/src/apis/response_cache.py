@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL: float = 6 * 60 * 60
+DEFAULT_MAX_BYTES: int = int(os.getenv("HTTP_CACHE_MAX_BYTES", 2 * 1024**3))
+# summing the cache size is a full scan, so only check it every so many writes
+EVICT_EVERY: int = 100
+
+
+def cache_key(url: str, parameters=None) -> str:
+    """Key a request by its url and sorted parameters"""
+    items = sorted((parameters or {}).items())
+    return hashlib.sha1(f"{url}?{items}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite backed cache of successful json responses.
+
+    Entries expire after the ttl registered for the longest matching url
+    prefix and the least recently used entries are evicted once the cache
+    grows past max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = {}
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, "
+                "body TEXT, size INTEGER, created_at REAL, accessed_at REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed "
+                "ON responses (accessed_at)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    def configure(self, url_prefix: str, ttl: float) -> None:
+        """Set the ttl in seconds for every url starting with url_prefix"""
+        self.ttls[url_prefix] = ttl
+
+    def ttl(self, url: str) -> float:
+        prefixes = [prefix for prefix in self.ttls if url.startswith(prefix)]
+        if not prefixes:
+            return DEFAULT_TTL
+        return self.ttls[max(prefixes, key=len)]
+
+    def get(self, url: str, parameters=None):
+        """Return the cached json for a request, or None on a miss"""
+        key = cache_key(url, parameters)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT body, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] < self.ttl(url):
+                conn.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+                with self._lock:
+                    self.hits += 1
+                return json.loads(row[0])
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, url: str, parameters, body: str) -> None:
+        """Store the raw json text of a successful response"""
+        key = cache_key(url, parameters)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, body, len(body.encode("utf-8")), now, now),
+            )
+            with self._lock:
+                self.writes += 1
+                check = self.writes % EVICT_EVERY == 0
+            if check:
+                self.evict(conn)
+
+    def evict(self, conn) -> None:
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[
+            0
+        ]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        stale = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+        logger.info(f"Evicted {len(stale)} cached responses ({freed} bytes)")
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process wide response cache, enabled by setting HTTP_CACHE_DB"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None and os.getenv("HTTP_CACHE_DB"):
+            _response_cache = ResponseCache(os.environ["HTTP_CACHE_DB"])
+    return _response_cache
@@ -1,104 +1,340 @@
 from src.apis.base_api import ApiClient
-from src.models.pydantic_models import SteamGameMetadata, SteamGameMetadataList
-from concurrent.futures import ThreadPoolExecutor
-from bs4 import BeautifulSoup
+from src.models.pydantic_models import (
+    SteamGameMetadata,
+    SteamGameMetadataList,
+)
+from src.helpers.metrics import metrics
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from src.helpers.html_text import html_to_text
 from datetime import datetime
+import threading
+import logging
+import asyncio
+import queue
+import os
 
 STEAM_BASE_SEARCH_URL: str = "http://store.steampowered.com"
+# the store allows roughly 200 appdetails requests every 5 minutes
+STEAM_STORE_RATE_LIMIT: float = float(os.getenv("STEAM_STORE_RATE_LIMIT", 0.66))
+STEAM_STORE_RATE_BURST: int = int(os.getenv("STEAM_STORE_RATE_BURST", 10))
+# well under the daily schedule, so retries hit the cache but the next run does not
+STEAM_STORE_CACHE_TTL: float = float(os.getenv("STEAM_STORE_CACHE_TTL", 6 * 60 * 60))
+# appdetails only accepts several appids per call when filtered to price_overview
+PRICE_BATCH_SIZE: int = 100
+
+logger = logging.getLogger(__name__)
+
+
+def parse_html(text):
+    return html_to_text(text)
+
+
+def process_steam_data(data: dict, date_added: datetime):
+    """Map a raw appdetails payload onto the SteamGameMetadata fields"""
+    try:
+        data = {
+            "type": data["type"],
+            "name": data["name"],
+            "appid": data["steam_appid"],
+            "required_age": data["required_age"],
+            "is_free": data["is_free"],
+            "dlc": data.get("dlc", []),
+            "controller_support": data.get("controller_support", None),
+            "about_the_game": parse_html(data.get("about_the_game", "")),
+            "detailed_description": parse_html(data.get("detailed_description", "")),
+            "short_description": parse_html(data.get("short_description", "")),
+            "supported_languages": parse_html(data.get("supported_languages", "")),
+            "reviews": parse_html(data.get("reviews", "")),
+            "header_image": data["header_image"],
+            "capsule_image": data["capsule_image"],
+            "website": data.get("website", ""),
+            "requirements": data["pc_requirements"],
+            "developers": data.get("developers", None),
+            "publishers": data.get("publishers", None),
+            "price_overview": data.get("price_overview", None),
+            "platform": data["platforms"],
+            "metacritic": data.get("metacritic", {}).get("score", 0),
+            "categories": data.get("categories", None),
+            "genres": data.get("genres", None),
+            "recommendations": data.get("recommendations", {}).get("total", 0),
+            "achievements_number": data.get("achievements", {}).get("total", 0),
+            "release_date": data["release_date"]["date"],
+            "coming_soon": data["release_date"]["coming_soon"],
+            "date_added": date_added,
+        }
+        return data
+
+    except KeyError as ke:
+        logger.error(f"The wrong key was not present {ke}")
+    return None
+
+
+def build_metadata(app_id: int, data, date_added: datetime):
+    """
+    Turn a raw appdetails response into a SteamGameMetadata record, validated
+    later with the rest of its batch.
+
+    Kept at module level so it can be shipped to a process pool.
+    """
+    if data:
+        resp = data[f"{app_id}"]
+
+        if resp["success"] == True:
+            data = resp["data"]
+            # process data
+            data = process_steam_data(data, date_added)
+            if data and data["appid"] == app_id:
+                return data
+            else:
+                logger.warning(f"unsuccessful for pulling {app_id} data ")
+                return None
+
+    logger.warning(f"Failed to fetch metadata for {app_id}")
+    return None
 
 
 class SteamStoreMetadata(ApiClient):
+    source = "steam_store"
+    model = SteamGameMetadata
 
-    def __init__(self, batch_size=100, num_workers=4):
-        super().__init__()
+    def __init__(
+        self,
+        batch_size=100,
+        num_workers=4,
+        max_in_flight=100,
+        hash_store=None,
+        checkpoint=None,
+        num_parsers=0,
+        queue_size=200,
+    ):
+        super().__init__(max_in_flight=max_in_flight)
         self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.hash_store = hash_store
         self.url = STEAM_BASE_SEARCH_URL
         self.num_workers = num_workers
+        self.num_parsers = num_parsers
+        self.queue_size = queue_size
         self.date_added = datetime.now()
+        self.rate_limiter.configure(
+            self.url, rate=STEAM_STORE_RATE_LIMIT, burst=STEAM_STORE_RATE_BURST
+        )
+        if self.cache:
+            self.cache.configure(self.url, ttl=STEAM_STORE_CACHE_TTL)
 
     def parser(self, text):
-        if text:
-            soup = BeautifulSoup(text, "lxml")
-            plain_text = soup.get_text("\n", strip=True)
-            return plain_text
-        return None
+        return parse_html(text)
 
     def process_steam_data(self, data: dict):
-        try:
-            data = {
-                "type": data["type"],
-                "name": data["name"],
-                "appid": data["steam_appid"],
-                "required_age": data["required_age"],
-                "is_free": data["is_free"],
-                "dlc": data.get("dlc", []),
-                "controller_support": data.get("controller_support", None),
-                "about_the_game": self.parser(data.get("about_the_game", "")),
-                "detailed_description": self.parser(
-                    data.get("detailed_description", "")
-                ),
-                "short_description": self.parser(data.get("short_description", "")),
-                "supported_languages": self.parser(data.get("supported_languages", "")),
-                "reviews": self.parser(data.get("reviews", "")),
-                "header_image": data["header_image"],
-                "capsule_image": data["capsule_image"],
-                "website": data.get("website", ""),
-                "requirements": data["pc_requirements"],
-                "developers": data.get("developers", None),
-                "publishers": data.get("publishers", None),
-                "price_overview": data.get("price_overview", None),
-                "platform": data["platforms"],
-                "metacritic": data.get("metacritic", {}).get("score", 0),
-                "categories": data.get("categories", None),
-                "genres": data.get("genres", None),
-                "recommendations": data.get("recommendations", {}).get("total", 0),
-                "achievements_number": data.get("achievements", {}).get("total", 0),
-                "release_date": data["release_date"]["date"],
-                "coming_soon": data["release_date"]["coming_soon"],
-                "date_added": self.date_added,
-            }
-            return SteamGameMetadata(**data)
+        return process_steam_data(data, self.date_added)
 
-        except KeyError as ke:
-            self.logger.error(f"The wrong key was not present {ke}")
-        return None
+    def handle_response(self, app_id: int, data):
+        """Map a raw appdetails response for a single appid onto a record"""
+        return build_metadata(app_id, data, self.date_added)
 
-    def fetch_metadata(self, app_id: int):
-        """Fetch metadata for a single appid"""
-        url = f"http://store.steampowered.com/api/appdetails/"
+    def unchanged(self, app_id: int, data) -> bool:
+        """Check a freshly fetched payload against the hash store"""
+        if not self.hash_store or not data:
+            return False
+        resp = data.get(f"{app_id}") or {}
+        if resp.get("success") != True:
+            return False
+        if self.hash_store.content_changed(app_id, resp["data"]):
+            return False
+        self.logger.info(f"Skipping unchanged app {app_id}")
+        metrics.inc("apps_unchanged_total", source=self.source)
+        return True
+
+    def fetch_raw(self, app_id: int):
+        """Download the raw appdetails response for a single appid"""
+        url = f"{self.url}/api/appdetails/"
         parameters = {"appids": app_id}
         data = self.get_request(url, parameters)
+        self.save_checkpoint(app_id, data)
+        if not data:
+            self.logger.warning(f"Failed to fetch metadata for {app_id}")
+            return None
+        if self.unchanged(app_id, data):
+            return None
+        return data
+
+    def fetch_metadata(self, app_id: int):
+        """Fetch metadata for a single appid"""
+        data = self.fetch_raw(app_id)
+        return self.handle_response(app_id, data) if data else None
 
-        if data:
-            resp = data[f"{app_id}"]
+    async def afetch_metadata(self, client, app_id: int):
+        """Fetch metadata for a single appid over the shared async client"""
+        url = f"{self.url}/api/appdetails/"
+        parameters = {"appids": app_id}
+        data = await self.async_get_request(client, url, parameters)
+        # the checkpoint and hash store write to SQLite, off the event loop
+        await asyncio.to_thread(self.save_checkpoint, app_id, data)
+        if await asyncio.to_thread(self.unchanged, app_id, data):
+            return None
+        return self.handle_response(app_id, data)
 
-            if resp["success"] == True:
-                data = resp["data"]
-                # process data
-                data = self.process_steam_data(data)
-                if data and data.appid == app_id:
-                    return data
-                else:
-                    self.logger.warning(f"unsuccessful for pulling {app_id} data ")
-                    return None
+    def fetch_price_overviews(self, app_ids):
+        """Fetch price_overview for many appids per call"""
+        url = f"{self.url}/api/appdetails/"
+        prices = {}
+        for i in range(0, len(app_ids), PRICE_BATCH_SIZE):
+            batch = app_ids[i : i + PRICE_BATCH_SIZE]
+            parameters = {
+                "appids": ",".join(str(app_id) for app_id in batch),
+                "filters": "price_overview",
+            }
+            data = self.get_request(url, parameters) or {}
+            for app_id in batch:
+                resp = data.get(f"{app_id}")
+                if resp and resp["success"] == True:
+                    # free games come back with an empty list instead of a dict
+                    prices[app_id] = (resp["data"] or {}).get("price_overview")
+        return prices
 
-        self.logger.warning(f"Failed to fetch metadata for {app_id}")
-        return None
+    def skip_unchanged(self, app_ids):
+        """Drop appids whose price is unchanged and were fully fetched recently"""
+        if not self.hash_store:
+            return app_ids
+        unchanged = self.hash_store.unchanged_prices(
+            self.fetch_price_overviews(app_ids)
+        )
+        if unchanged:
+            self.logger.info(f"Skipping {len(unchanged)} apps with unchanged prices")
+            metrics.inc("apps_unchanged_total", len(unchanged), source=self.source)
+        return [app_id for app_id in app_ids if app_id not in unchanged]
 
+    @metrics.timed("fetch_batch_seconds", source="steam_store")
     def process_batch(self, app_ids):
         """Fetch metadata for a batch of appIDS in parallel"""
         with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
             results = list(executor.map(self.fetch_metadata, app_ids))
-        return [result for result in results if result]
-
-    def run(self, app_ids):
-        all_data = []
+        return self.keep_fetched(results)
 
+    def iter_batches(self, app_ids):
+        """Yield validated records batch by batch as they are fetched"""
+        done, app_ids = self.resume(app_ids)
+        yield from self.iter_replayed(done)
+        if self.num_parsers:
+            yield from self.iter_pipelined(app_ids)
+            return
         for i in range(0, len(app_ids), self.batch_size):
             batch = app_ids[i : i + self.batch_size]
             self.logger.info(f"Processing batch: {batch}")
+            batch = self.skip_unchanged(batch)
             batch_data = self.process_batch(batch)
             if batch_data:
-                all_data.extend(batch_data)
+                yield self.validate_batch(batch_data)
+
+    def iter_pipelined(self, app_ids):
+        """
+        Yield validated records with downloading and parsing split into two stages.
+
+        Fetch threads only download raw payloads onto a bounded queue, while a
+        pool of num_parsers processes strips the HTML and builds the models, so
+        parsing scales across cores instead of competing with the network
+        workers for the GIL.
+        """
+        raw_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        # a failed download ends the stream, the consumer raises it
+        errors = []
+
+        def download(app_id):
+            item = (app_id, self.fetch_raw(app_id))
+            while not stop.is_set():
+                try:
+                    raw_queue.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    continue
+
+        def produce(fetchers):
+            try:
+                for i in range(0, len(app_ids), self.batch_size):
+                    if stop.is_set():
+                        break
+                    batch = app_ids[i : i + self.batch_size]
+                    self.logger.info(f"Processing batch: {batch}")
+                    list(fetchers.map(download, self.skip_unchanged(batch)))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                raw_queue.put(None)
+
+        def collect(finished):
+            return self.keep_fetched([f.result() for f in finished])
+
+        with ThreadPoolExecutor(
+            max_workers=self.num_workers
+        ) as fetchers, ProcessPoolExecutor(max_workers=self.num_parsers) as parsers:
+            producer = threading.Thread(target=produce, args=(fetchers,), daemon=True)
+            producer.start()
+            pending, batch_data = set(), []
+            try:
+                while (item := raw_queue.get()) is not None:
+                    app_id, data = item
+                    if data:
+                        pending.add(
+                            parsers.submit(
+                                build_metadata, app_id, data, self.date_added
+                            )
+                        )
+                    if len(pending) >= self.queue_size:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        batch_data.extend(collect(finished))
+                    if len(batch_data) >= self.batch_size:
+                        yield self.validate_batch(batch_data)
+                        batch_data = []
+                if errors:
+                    raise errors[0]
+                finished, pending = wait(pending)
+                batch_data.extend(collect(finished))
+                if batch_data:
+                    yield self.validate_batch(batch_data)
+            finally:
+                stop.set()
+                # unblock the producer if the consumer stopped early
+                while producer.is_alive():
+                    try:
+                        raw_queue.get(timeout=1)
+                    except queue.Empty:
+                        pass
+
+    async def aiter_batches(self, app_ids):
+        """Async version of iter_batches, fetching each batch bounded by max_in_flight"""
+        done, app_ids = await asyncio.to_thread(self.resume, app_ids)
+        for batch_data in self.iter_replayed(done):
+            yield batch_data
+        async with self.async_client() as client:
+            for i in range(0, len(app_ids), self.batch_size):
+                batch = app_ids[i : i + self.batch_size]
+                self.logger.info(f"Processing batch: {batch}")
+                batch = await asyncio.to_thread(self.skip_unchanged, batch)
+                results = await self.gather_bounded(
+                    lambda app_id: self.afetch_metadata(client, app_id), batch
+                )
+                batch_data = self.keep_fetched(results)
+                if batch_data:
+                    yield self.validate_batch(batch_data)
+
+    def run(self, app_ids):
+        """Fetch all appids, each batch is validated as it arrives so the list is not"""
+        all_data = []
+        for batch_data in self.iter_batches(app_ids):
+            all_data.extend(batch_data)
+
+        return SteamGameMetadataList.model_construct(games=all_data)
+
+    async def arun(self, app_ids):
+        """Fetch all appids concurrently, bounded by max_in_flight"""
+        all_data = []
+        async for batch_data in self.aiter_batches(app_ids):
+            all_data.extend(batch_data)
 
-        return SteamGameMetadataList(games=all_data)
+        return SteamGameMetadataList.model_construct(games=all_data)
@@ -10,6 +10,9 @@ class SteamTop100(ApiClient):
     def __init__(self):
         super().__init__()
         self.url = STEAM_TOP_GAMES
+        if self.cache:
+            # the chart rolls over daily, keep reruns within the hour cheap
+            self.cache.configure(self.url, ttl=60 * 60)
 
     def run(self):
 
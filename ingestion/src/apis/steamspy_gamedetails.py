@@ -1,44 +1,170 @@
 from src.apis.base_api import ApiClient
-from src.models.pydantic_models import GameDetailsList
-from datetime import datetime
+from src.models.pydantic_models import GameDetails, GameDetailsList
+from src.helpers.metrics import metrics
+from datetime import datetime, timedelta
+import os
+import asyncio
+import time
 
 STEAMSPY_BASE_URL: str = "https://steamspy.com/api.php"
+# steamspy allows 1 request per second on appdetails
+STEAMSPY_RATE_LIMIT: float = float(os.getenv("STEAMSPY_RATE_LIMIT", 1))
+STEAMSPY_RATE_BURST: int = int(os.getenv("STEAMSPY_RATE_BURST", 1))
+# well under the daily schedule, so retries hit the cache but the next run does not
+STEAMSPY_CACHE_TTL: float = float(os.getenv("STEAMSPY_CACHE_TTL", 6 * 60 * 60))
+# request=all is limited separately to 1 page per minute
+STEAMSPY_BULK_PAGE_INTERVAL: float = float(os.getenv("STEAMSPY_BULK_PAGE_INTERVAL", 60))
+# appdetails fields the request=all pages leave out
+STEAMSPY_BULK_OMITTED: tuple = ("tags", "languages", "genre")
+# days the omitted fields are carried over before appdetails is called again
+STEAMSPY_DETAILS_FRESHNESS_DAYS: float = float(
+    os.getenv("STEAMSPY_DETAILS_FRESHNESS_DAYS", 7)
+)
 from concurrent.futures import ThreadPoolExecutor
 
 
 class SteamSpyMetadataFetcher(ApiClient):
+    source = "steamspy"
+    model = GameDetails
 
-    def __init__(self, batch_size=100, num_workers=4):
-        super().__init__()
+    def __init__(
+        self, batch_size=100, num_workers=4, max_in_flight=100, checkpoint=None
+    ):
+        super().__init__(max_in_flight=max_in_flight)
         self.batch_size = batch_size
+        self.checkpoint = checkpoint
         self.url = STEAMSPY_BASE_URL
         self.num_workers = num_workers
         self.date_added = datetime.now()
+        self.rate_limiter.configure(
+            self.url, rate=STEAMSPY_RATE_LIMIT, burst=STEAMSPY_RATE_BURST
+        )
+        if self.cache:
+            self.cache.configure(self.url, ttl=STEAMSPY_CACHE_TTL)
 
-    def fetch_metadata(self, app_id):
-        """Fetch metadata for a single appid"""
-        parameters = {"request": "appdetails", "appid": app_id}
-        data = self.get_request(self.url, parameters)
-        data["date_added"] = self.date_added
+    def handle_response(self, app_id, data):
+        """Attach the scrape date to a raw appdetails response"""
         if not data:
             self.logger.warning(f"Failed to fetchmetadata for {app_id}")
             return None
+        data["date_added"] = self.date_added
+        data.setdefault("details_date", self.date_added)
         return data
 
+    def fetch_metadata(self, app_id):
+        """Fetch metadata for a single appid"""
+        parameters = {"request": "appdetails", "appid": app_id}
+        data = self.get_request(self.url, parameters)
+        self.save_checkpoint(app_id, data)
+        return self.handle_response(app_id, data)
+
+    async def afetch_metadata(self, client, app_id):
+        """Fetch metadata for a single appid over the shared async client"""
+        parameters = {"request": "appdetails", "appid": app_id}
+        data = await self.async_get_request(client, self.url, parameters)
+        # the checkpoint writes to SQLite, off the event loop
+        await asyncio.to_thread(self.save_checkpoint, app_id, data)
+        return self.handle_response(app_id, data)
+
+    @metrics.timed("fetch_batch_seconds", source="steamspy")
     def process_batch(self, app_ids):
         """Fetch metadata for a batch of appIDS in parallel"""
         with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
             results = list(executor.map(self.fetch_metadata, app_ids))
-        return [result for result in results if result]
-
-    def run(self, app_ids):
-        all_data = []
+        return self.keep_fetched(results)
 
+    def iter_batches(self, app_ids):
+        """Yield validated records batch by batch as they are fetched"""
+        done, app_ids = self.resume(app_ids)
+        yield from self.iter_replayed(done)
         for i in range(0, len(app_ids), self.batch_size):
             batch = app_ids[i : i + self.batch_size]
             self.logger.info(f"Processing batch: {batch}")
             batch_data = self.process_batch(batch)
             if batch_data:
-                all_data.extend(batch_data)
+                yield self.validate_batch(batch_data)
+
+    async def aiter_batches(self, app_ids):
+        """Async version of iter_batches, fetching each batch bounded by max_in_flight"""
+        done, app_ids = await asyncio.to_thread(self.resume, app_ids)
+        for batch_data in self.iter_replayed(done):
+            yield batch_data
+        async with self.async_client() as client:
+            for i in range(0, len(app_ids), self.batch_size):
+                batch = app_ids[i : i + self.batch_size]
+                self.logger.info(f"Processing batch: {batch}")
+                results = await self.gather_bounded(
+                    lambda app_id: self.afetch_metadata(client, app_id), batch
+                )
+                batch_data = self.keep_fetched(results)
+                if batch_data:
+                    yield self.validate_batch(batch_data)
+
+    def fetch_page(self, page: int):
+        """Fetch a page of ~1000 apps from the bulk request=all endpoint"""
+        parameters = {"request": "all", "page": page}
+        return self.get_request(self.url, parameters)
+
+    def iter_bulk_batches(self, app_ids, stored_details=None):
+        """
+        Yield validated records using the paged request=all endpoint.
+
+        Pages are joined against app_ids and yielded as they arrive. The bulk
+        endpoint omits tags, languages and genre, so those are carried over
+        from stored_details, appid to the values already loaded and the
+        details_date they were scraped on. Appids without stored details, with
+        details older than STEAMSPY_DETAILS_FRESHNESS_DAYS or not found in any
+        page fall back to appdetails calls.
+        """
+        cutoff = self.date_added - timedelta(days=STEAMSPY_DETAILS_FRESHNESS_DAYS)
+        stored_details = {
+            app_id: details
+            for app_id, details in (stored_details or {}).items()
+            if details.get("details_date")
+            and details["details_date"].replace(tzinfo=None) > cutoff
+        }
+        remaining = set(app_ids) & set(stored_details)
+        page = 0
+        while remaining:
+            if page:
+                time.sleep(STEAMSPY_BULK_PAGE_INTERVAL)
+            data = self.fetch_page(page)
+            if not data:
+                break
+            batch_data = []
+            for row in data.values():
+                if row.get("appid") in remaining:
+                    remaining.discard(row["appid"])
+                    row.update(stored_details[row["appid"]])
+                    batch_data.append(self.handle_response(row["appid"], row))
+            self.logger.info(
+                f"Bulk page {page} matched {len(batch_data)} apps, {len(remaining)} remaining"
+            )
+            if batch_data:
+                yield self.validate_batch(batch_data)
+            page += 1
+
+        fallback = [
+            app_id
+            for app_id in app_ids
+            if app_id in remaining or app_id not in stored_details
+        ]
+        if fallback:
+            self.logger.info(f"Falling back to appdetails for {len(fallback)} apps")
+            yield from self.iter_batches(fallback)
+
+    def run(self, app_ids):
+        """Fetch all appids, each batch is validated as it arrives so the list is not"""
+        all_data = []
+        for batch_data in self.iter_batches(app_ids):
+            all_data.extend(batch_data)
+
+        return GameDetailsList.model_construct(games=all_data)
+
+    async def arun(self, app_ids):
+        """Fetch all appids concurrently, bounded by max_in_flight"""
+        all_data = []
+        async for batch_data in self.aiter_batches(app_ids):
+            all_data.extend(batch_data)
 
-        return GameDetailsList(games=all_data)
+        return GameDetailsList.model_construct(games=all_data)
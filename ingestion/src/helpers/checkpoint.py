@@ -0,0 +1,65 @@
+import json
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    """
+    SQLite store of the raw payloads fetched during a run.
+
+    Payloads are keyed by run id, source and appid so a retried or resumed run
+    can replay what it already fetched and only request the remainder.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints (run_id TEXT, source TEXT, "
+                "appid INTEGER, payload TEXT, PRIMARY KEY (run_id, source, appid))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    def for_run(self, run_id: str, source: str) -> "RunCheckpoint":
+        return RunCheckpoint(self, run_id, source)
+
+
+class RunCheckpoint:
+    """Checkpoint of a single source within a run"""
+
+    def __init__(self, store: CheckpointStore, run_id: str, source: str):
+        self.store = store
+        self.run_id = str(run_id)
+        self.source = source
+
+    def load(self) -> dict:
+        """Return the payloads fetched so far keyed by appid"""
+        with self.store._connect() as conn:
+            rows = conn.execute(
+                "SELECT appid, payload FROM checkpoints WHERE run_id = ? AND source = ?",
+                (self.run_id, self.source),
+            ).fetchall()
+        if rows:
+            logger.info(
+                f"Resuming {self.source} run {self.run_id} with {len(rows)} apps"
+            )
+        return {appid: json.loads(payload) for appid, payload in rows}
+
+    def save(self, app_id: int, payload) -> None:
+        with self.store._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)",
+                (self.run_id, self.source, app_id, json.dumps(payload, default=str)),
+            )
+
+    def clear(self) -> None:
+        """Drop the checkpoint once the run has been loaded"""
+        with self.store._connect() as conn:
+            conn.execute(
+                "DELETE FROM checkpoints WHERE run_id = ? AND source = ?",
+                (self.run_id, self.source),
+            )
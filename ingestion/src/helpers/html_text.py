@@ -0,0 +1,55 @@
+from lxml import etree
+
+# bs4 keeps the contents of these tags out of get_text
+SKIPPED_TAGS = {"script", "style", "template"}
+
+
+class TextCollector:
+    """
+    lxml parser target that collects stripped text nodes without building a tree.
+
+    Mirrors BeautifulSoup(text, "lxml").get_text("\\n", strip=True): text is
+    split into strings at every tag or comment boundary, each string is
+    stripped, empty ones are dropped and the rest are joined with newlines.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.buffer = []
+        self.skip = 0
+
+    def flush(self):
+        if self.buffer:
+            text = "".join(self.buffer).strip()
+            self.buffer = []
+            if text and not self.skip:
+                self.parts.append(text)
+
+    def start(self, tag, attrib):
+        self.flush()
+        if tag in SKIPPED_TAGS:
+            self.skip += 1
+
+    def end(self, tag):
+        self.flush()
+        if tag in SKIPPED_TAGS:
+            self.skip -= 1
+
+    def data(self, data):
+        self.buffer.append(data)
+
+    def comment(self, text):
+        self.flush()
+
+    def close(self):
+        self.flush()
+        return "\n".join(self.parts)
+
+
+def html_to_text(text):
+    """Extract the visible text of an html fragment, one string per line"""
+    if not text:
+        return None
+    parser = etree.HTMLParser(target=TextCollector())
+    parser.feed(text)
+    return parser.close()
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+from prefect.artifacts import create_table_artifact
+from prefect.runtime import flow_run
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def metric_key(name: str, labels: dict = None) -> tuple:
+    return (name, tuple(sorted((labels or {}).items())))
+
+
+def render_key(key: tuple, extra: dict = None) -> str:
+    """Render a metric key the way prometheus writes series"""
+    name, labels = key
+    labels = dict(labels, **(extra or {}))
+    if not labels:
+        return name
+    pairs = ",".join(f'{label}="{value}"' for label, value in labels.items())
+    return f"{name}{{{pairs}}}"
+
+
+class Histogram:
+    """Bucketed observations, mergeable across processes"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": list(self.buckets),
+            "counts": self.counts,
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Histogram":
+        histogram = cls(data["buckets"])
+        histogram.counts = list(data["counts"])
+        histogram.count = data["count"]
+        histogram.sum = data["sum"]
+        histogram.max = data["max"]
+        return histogram
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+
+class Metrics:
+    """
+    Process wide counters and latency histograms for a run.
+
+    Counters and histograms are keyed by name and an optional set of labels,
+    and can be exported as json or prometheus text, or published to the
+    running flow as a Prefect artifact. Work done in a process pool is
+    recorded there and folded back in with merge(snapshot()).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = metric_key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = metric_key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the wall time of the with block in the name histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels):
+        """Decorator version of timer"""
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self) -> dict:
+        """Picklable copy of every counter and histogram"""
+        with self._lock:
+            return {
+                "counters": [
+                    [name, dict(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    [name, dict(labels), histogram.to_dict()]
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+            }
+
+    def merge(self, snapshot: dict) -> None:
+        """Fold in a snapshot taken in another process"""
+        for name, labels, value in snapshot["counters"]:
+            self.inc(name, value, **labels)
+        for name, labels, data in snapshot["histograms"]:
+            key = metric_key(name, labels)
+            with self._lock:
+                if key in self.histograms:
+                    self.histograms[key].merge(Histogram.from_dict(data))
+                else:
+                    self.histograms[key] = Histogram.from_dict(data)
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            typed = set()
+            for key, value in sorted(self.counters.items()):
+                if key[0] not in typed:
+                    typed.add(key[0])
+                    lines.append(f"# TYPE {key[0]} counter")
+                lines.append(f"{render_key(key)} {value}")
+            for key, histogram in sorted(self.histograms.items()):
+                if key[0] not in typed:
+                    typed.add(key[0])
+                    lines.append(f"# TYPE {key[0]} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    series = render_key((f"{key[0]}_bucket", key[1]), {"le": bound})
+                    lines.append(f"{series} {cumulative}")
+                series = render_key((f"{key[0]}_bucket", key[1]), {"le": "+Inf"})
+                lines.append(f"{series} {histogram.count}")
+                lines.append(f"{render_key((f'{key[0]}_sum', key[1]))} {histogram.sum}")
+                lines.append(
+                    f"{render_key((f'{key[0]}_count', key[1]))} {histogram.count}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def table(self) -> list:
+        """One row per series, for the Prefect table artifact"""
+        rows = []
+        with self._lock:
+            for key, value in sorted(self.counters.items()):
+                rows.append({"metric": render_key(key), "value": value})
+            for key, histogram in sorted(self.histograms.items()):
+                rows.append(
+                    {
+                        "metric": render_key(key),
+                        "value": round(histogram.sum, 3),
+                        "count": histogram.count,
+                        "p50": round(histogram.quantile(0.5), 3),
+                        "p95": round(histogram.quantile(0.95), 3),
+                        "max": round(histogram.max, 3),
+                    }
+                )
+        return rows
+
+    def publish(self, run_name: str) -> None:
+        """
+        Export the run's metrics as a Prefect table artifact, and as json and
+        prometheus text files in METRICS_DIR when it is set, then start afresh
+        for the next run in the same process.
+
+        The files are named after the publish time and the flow run id, or the
+        process id outside a flow, so every run keeps its own.
+        """
+        metrics_dir = os.getenv("METRICS_DIR")
+        if metrics_dir:
+            os.makedirs(metrics_dir, exist_ok=True)
+            published = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+            name = f"{run_name}-{published}-{flow_run.id or os.getpid()}"
+            with open(os.path.join(metrics_dir, f"{name}.json"), "w") as f:
+                f.write(self.to_json())
+            with open(os.path.join(metrics_dir, f"{name}.prom"), "w") as f:
+                f.write(self.to_prometheus())
+            logger.info(f"Wrote {run_name} metrics to {metrics_dir}/{name}")
+        try:
+            # async tasks publish too, where prefect would hand back a coroutine
+            create_table_artifact(
+                key=f"{run_name}-metrics",
+                table=self.table(),
+                description=f"Per stage metrics of the {run_name} run",
+                _sync=True,
+            )
+        except Exception as e:
+            logger.warning(f"Could not publish {run_name} metrics artifact: {e}")
+        self.reset()
+
+
+metrics = Metrics()
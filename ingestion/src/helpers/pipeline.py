@@ -1,8 +1,64 @@
+import os
+import threading
+
 import dlt
 
+# one duckdb connection per process, dlt hands each thread a cursor of it.
+# connections opened separately race to attach the same file
+_duckdb_conn = None
+_duckdb_lock = threading.Lock()
+# duckdb takes one writer per file, concurrent loads conflict on catalog writes
+_load_lock = threading.Lock()
+
+
+def duckdb_connection():
+    # only the local destination modes need duckdb installed
+    import duckdb
+
+    global _duckdb_conn
+    with _duckdb_lock:
+        if _duckdb_conn is None:
+            # dbt's local target reads the same file
+            _duckdb_conn = duckdb.connect(os.getenv("DUCKDB_PATH", "steam.duckdb"))
+        return _duckdb_conn
+
 
-def create_pipeline(pipeline_name: str, dataset_name: str, destination="bigquery"):
+def get_destination(destination: str = None):
+    """
+    Resolve a destination name to what dlt.pipeline takes as destination.
+
+    DESTINATION picks it when none is given: bigquery in production, or duckdb
+    or parquet files on local disk to run full ingest, clean and dbt cycles
+    without a warehouse.
+    """
+    destination = destination or os.getenv("DESTINATION", "bigquery")
+    if destination == "duckdb":
+        return dlt.destinations.duckdb(duckdb_connection())
+    if destination == "filesystem":
+        return dlt.destinations.filesystem(
+            bucket_url=os.getenv("FILESYSTEM_BUCKET_URL", "data"),
+            preferred_loader_file_format="parquet",
+        )
+    return destination
+
+
+def create_pipeline(pipeline_name: str, dataset_name: str, destination: str = None):
 
     return dlt.pipeline(
-        pipeline_name=pipeline_name, dataset_name=dataset_name, destination=destination
+        pipeline_name=pipeline_name,
+        dataset_name=dataset_name,
+        destination=get_destination(destination),
     )
+
+
+def run_pipeline(pipeline: dlt.pipeline, data, **kwargs):
+    """
+    pipeline.run, except that on duckdb the load step of concurrent pipelines
+    is queued. Extract and normalize still overlap.
+    """
+    if pipeline.destination.destination_name != "duckdb":
+        return pipeline.run(data, **kwargs)
+    pipeline.extract(data, **kwargs)
+    pipeline.normalize()
+    with _load_lock:
+        return pipeline.load()
@@ -0,0 +1,70 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# log at most once every so many rows or seconds, whichever comes first
+PROGRESS_EVERY_ROWS: int = 100_000
+PROGRESS_EVERY_SECONDS: float = 30
+# rows counted one at a time between looks at the clock
+CLOCK_EVERY_ROWS: int = 1000
+
+
+class ProgressLogger:
+    """
+    Aggregated progress logging for streams of rows.
+
+    Rather than one log line per row, a line with the running total and the
+    rows per second is written every `every` rows or `interval` seconds, plus
+    a summary once the stream is done.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        every: int = PROGRESS_EVERY_ROWS,
+        interval: float = PROGRESS_EVERY_SECONDS,
+        log: logging.Logger = logger,
+    ):
+        self.name = name
+        self.every = every
+        self.interval = interval
+        self.log = log
+        self.rows = 0
+        self.start = self.last_time = time.perf_counter()
+        self.last_rows = 0
+        self.next_check = CLOCK_EVERY_ROWS
+
+    def update(self, rows: int = 1) -> None:
+        self.rows += rows
+        if self.rows - self.last_rows >= self.every:
+            self.report()
+        elif rows > 1 or self.rows >= self.next_check:
+            # per row, reading the clock would cost more than the logging saved
+            self.next_check = self.rows + CLOCK_EVERY_ROWS
+            if time.perf_counter() - self.last_time >= self.interval:
+                self.report()
+
+    def report(self) -> None:
+        now = time.perf_counter()
+        rate = (self.rows - self.last_rows) / max(now - self.last_time, 1e-9)
+        self.log.info(f"{self.name}: {self.rows} rows ({rate:,.0f} rows/s)")
+        self.last_rows = self.rows
+        self.last_time = now
+
+    def close(self) -> None:
+        """Log the total and the average rate of the stream"""
+        elapsed = time.perf_counter() - self.start
+        self.log.info(
+            f"{self.name}: {self.rows} rows in {elapsed:.2f}s "
+            f"({self.rows / max(elapsed, 1e-9):,.0f} rows/s)"
+        )
+
+    def track(self, items, size=None):
+        """Yield items, counting each as one row or as size(item) rows"""
+        try:
+            for item in items:
+                yield item
+                self.update(size(item) if size else 1)
+        finally:
+            self.close()
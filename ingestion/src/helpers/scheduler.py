@@ -0,0 +1,80 @@
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# extra refreshes per freshness window given to the top ranked game, falling
+# off linearly to none at rank 100
+RANK_WEIGHT: float = 3.0
+# extra refreshes for games that moved a full 100 places since last week
+VOLATILITY_WEIGHT: float = 2.0
+# extra refreshes for games whose price changes often
+PRICE_WEIGHT: float = 2.0
+# price changes after which a game counts as changing as often as any
+PRICE_CHANGES_CAP: int = 10
+# appids refreshed per run, about an hour of the store's 0.66 requests per
+# second, so a run stays bounded however many apps fall due
+DEFAULT_BUDGET: int = 2000
+
+
+class RefreshScheduler:
+    """
+    Ranks appids by how overdue a refresh is and fills a per-run budget.
+
+    Every appid is due once every freshness_days. Games high in the top 100,
+    moving through it quickly or changing price often get a weight that
+    shortens that interval, so the request quota goes to the data that
+    actually changes. An appid's priority is the number of its intervals
+    elapsed since its last fetch, and appids never fetched come first.
+    """
+
+    def __init__(self, freshness_days: float = 7, budget: int = DEFAULT_BUDGET):
+        self.freshness_days = freshness_days
+        self.budget = budget
+
+    def weight(self, rank=None, price_changes: int = 0) -> float:
+        """Refreshes per freshness window for an appid"""
+        weight = 1.0
+        if rank is not None:
+            current = rank["rank"]
+            # games new to the chart have a last_week_rank of 0
+            previous = rank["last_week_rank"] or 101
+            weight += RANK_WEIGHT * max(101 - current, 0) / 100
+            weight += VOLATILITY_WEIGHT * min(abs(previous - current), 100) / 100
+        weight += (
+            PRICE_WEIGHT * min(price_changes, PRICE_CHANGES_CAP) / (PRICE_CHANGES_CAP)
+        )
+        return weight
+
+    def priority(self, last_fetched, weight: float, now: datetime) -> float:
+        if last_fetched is None:
+            return float("inf")
+        age_days = (now - last_fetched).total_seconds() / 86400
+        return age_days * weight / self.freshness_days
+
+    def schedule(
+        self, ranks: list, last_fetched: dict, price_changes: dict = None
+    ) -> list:
+        """
+        Return the due appids in priority order, capped at the budget.
+
+        ranks are today's top 100 records, last_fetched maps each known appid
+        to its last fetch date and price_changes its number of price changes.
+        """
+        now = datetime.now()
+        price_changes = price_changes or {}
+        ranks_by_appid = {rank["appid"]: rank for rank in ranks}
+        priorities = {}
+        for appid in set(ranks_by_appid) | set(last_fetched):
+            weight = self.weight(ranks_by_appid.get(appid), price_changes.get(appid, 0))
+            priority = self.priority(last_fetched.get(appid), weight, now)
+            if priority >= 1:
+                priorities[appid] = priority
+
+        due = sorted(priorities, key=priorities.get, reverse=True)
+        scheduled = due[: self.budget] if self.budget else due
+        logger.info(
+            f"Scheduled {len(scheduled)} of {len(due)} due app IDs "
+            f"with a budget of {self.budget or 'unlimited'}"
+        )
+        return scheduled
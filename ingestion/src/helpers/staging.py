@@ -0,0 +1,368 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pydantic import BaseModel
+import dlt
+from dlt.common.normalizers.json.helpers import get_nested_row_hash, get_row_hash
+
+logger = logging.getLogger(__name__)
+
+# codec of the staged parquet files, the html text columns compress well
+RAW_STAGING_COMPRESSION = os.getenv("RAW_STAGING_COMPRESSION", "zstd")
+
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+
+# hard delete flag of the child tables, set only on the rows that never land
+DELETED_COLUMN = "_staging_deleted"
+
+STEAM_STORE_SCHEMA = pa.schema(
+    [
+        ("type", pa.string()),
+        ("name", pa.string()),
+        ("appid", pa.int64()),
+        ("date_added", TIMESTAMP),
+        ("required_age", pa.int64()),
+        ("is_free", pa.bool_()),
+        ("dlc", pa.list_(pa.int64())),
+        ("controller_support", pa.string()),
+        ("about_the_game", pa.string()),
+        ("detailed_description", pa.string()),
+        ("short_description", pa.string()),
+        ("supported_languages", pa.string()),
+        ("reviews", pa.string()),
+        ("header_image", pa.string()),
+        ("capsule_image", pa.string()),
+        ("website", pa.string()),
+        (
+            "requirements",
+            pa.struct([("minimum", pa.string()), ("recommended", pa.string())]),
+        ),
+        ("developers", pa.list_(pa.string())),
+        ("publishers", pa.list_(pa.string())),
+        (
+            "price_overview",
+            pa.struct(
+                [
+                    ("currency", pa.string()),
+                    ("initial", pa.int64()),
+                    ("final", pa.int64()),
+                    ("discount_percent", pa.int64()),
+                    ("initial_formatted", pa.string()),
+                    ("final_formatted", pa.string()),
+                ]
+            ),
+        ),
+        (
+            "platform",
+            pa.struct(
+                [("windows", pa.bool_()), ("mac", pa.bool_()), ("linux", pa.bool_())]
+            ),
+        ),
+        ("metacritic", pa.int64()),
+        (
+            "categories",
+            pa.list_(pa.struct([("id", pa.int64()), ("description", pa.string())])),
+        ),
+        (
+            "genres",
+            pa.list_(pa.struct([("id", pa.string()), ("description", pa.string())])),
+        ),
+        ("recommendations", pa.int64()),
+        ("achievements_number", pa.int64()),
+        ("release_date", pa.string()),
+        ("coming_soon", pa.bool_()),
+    ]
+)
+
+STEAMSPY_SCHEMA = pa.schema(
+    [
+        ("appid", pa.int64()),
+        ("name", pa.string()),
+        ("date_added", TIMESTAMP),
+        ("developer", pa.string()),
+        ("publisher", pa.string()),
+        ("score_rank", pa.string()),
+        ("positive", pa.int64()),
+        ("negative", pa.int64()),
+        ("userscore", pa.float64()),
+        ("owners", pa.string()),
+        ("average_forever", pa.int64()),
+        ("average_2weeks", pa.int64()),
+        ("median_forever", pa.int64()),
+        ("median_2weeks", pa.int64()),
+        ("price", pa.int64()),
+        ("initialprice", pa.int64()),
+        ("discount", pa.string()),
+        ("ccu", pa.int64()),
+        ("languages", pa.string()),
+        ("genre", pa.string()),
+        # a json object of tag votes, the column the warehouse keeps as json
+        ("tags", pa.string()),
+        ("details_date", TIMESTAMP),
+    ]
+)
+
+SCHEMAS = {"steam_store": STEAM_STORE_SCHEMA, "steamspy": STEAMSPY_SCHEMA}
+# columns staged as json text that the warehouse keeps as json
+JSON_COLUMNS = {"steam_store": [], "steamspy": ["tags"]}
+
+
+def get_staging(source: str):
+    """Staging area of source under RAW_STAGING_DIR, None when staging is off"""
+    directory = os.getenv("RAW_STAGING_DIR")
+    if not directory:
+        return None
+    return RawStaging(directory, source, SCHEMAS[source])
+
+
+def load_date_today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def to_dicts(batch: list) -> list:
+    """Validated batches hold models, or plain dicts in sampled mode"""
+    return [
+        record.model_dump() if isinstance(record, BaseModel) else record
+        for record in batch
+    ]
+
+
+def steam_store_table(batch: list) -> pa.Table:
+    return pa.Table.from_pylist(to_dicts(batch), schema=STEAM_STORE_SCHEMA)
+
+
+def steamspy_table(batch: list) -> pa.Table:
+    records = to_dicts(batch)
+    for record in records:
+        for column in JSON_COLUMNS["steamspy"]:
+            if record.get(column) is not None:
+                # compact, as dlt writes the json it normalizes itself
+                record[column] = json.dumps(record[column], separators=(",", ":"))
+    return pa.Table.from_pylist(records, schema=STEAMSPY_SCHEMA)
+
+
+TO_TABLE = {"steam_store": steam_store_table, "steamspy": steamspy_table}
+
+
+class RawStaging:
+    """
+    Fetched records of a source staged as parquet ahead of the load.
+
+    Each batch is written with the source's arrow schema to its own zstd
+    compressed file in a load_date=YYYY-MM-DD partition, so a day's fetches
+    can be loaded again without calling the apis.
+    """
+
+    def __init__(self, directory: str, source: str, schema: pa.Schema):
+        self.directory = os.path.join(directory, source)
+        self.source = source
+        self.schema = schema
+
+    def partition(self, load_date: str) -> str:
+        return os.path.join(self.directory, f"load_date={load_date}")
+
+    def write(self, batch: list, load_date: str = None) -> pa.Table:
+        """Stage a validated batch, returning it as an arrow table"""
+        table = TO_TABLE[self.source](batch)
+        partition = self.partition(load_date or load_date_today())
+        os.makedirs(partition, exist_ok=True)
+        # nanosecond names keep the files in fetch order, the pid and thread
+        # id keep concurrent writers apart
+        name = f"part-{time.time_ns()}-{os.getpid()}-{threading.get_ident()}.parquet"
+        path = os.path.join(partition, name)
+        pq.write_table(table, f"{path}.tmp", compression=RAW_STAGING_COMPRESSION)
+        os.replace(f"{path}.tmp", path)
+        logger.info(f"Staged {table.num_rows} {self.source} rows to {path}")
+        return table
+
+    def read(self, load_date: str = None) -> pa.Table:
+        """
+        All the rows staged on load_date, today by default.
+
+        An app fetched more than once that day keeps its last fetched row, so
+        the table can be upserted in one load.
+        """
+        partition = self.partition(load_date or load_date_today())
+        if not os.path.isdir(partition):
+            return self.schema.empty_table()
+        files = sorted(
+            name for name in os.listdir(partition) if name.endswith(".parquet")
+        )
+        if not files:
+            return self.schema.empty_table()
+        table = pa.concat_tables(
+            pq.read_table(os.path.join(partition, name), schema=self.schema)
+            for name in files
+        )
+        # the highest row number per appid is the last fetched row
+        last = (
+            table.append_column("row", pa.array(np.arange(table.num_rows)))
+            .group_by("appid")
+            .aggregate([("row", "max")])
+        )
+        return table.take(np.sort(last["row_max"].to_numpy()))
+
+
+def row_ids(keys: list, primary_key: str = "appid") -> list:
+    """The _dlt_id dlt derives from the primary key of an upserted row"""
+    return [get_row_hash({primary_key: key}, subset=[primary_key]) for key in keys]
+
+
+def flatten_structs(table: pa.Table) -> pa.Table:
+    """Unnest struct columns into parent__child columns, as dlt names them"""
+    while any(pa.types.is_struct(field.type) for field in table.schema):
+        table = table.flatten()
+    return table.rename_columns(
+        [name.replace(".", "__") for name in table.column_names]
+    )
+
+
+def nested_table(
+    lists: pa.ChunkedArray, parent_ids: pa.Array, table_name: str
+) -> pa.Table:
+    """
+    One row per list element, linked to its parent row the way dlt links the
+    child tables it unnests lists into.
+    """
+    lists = lists.combine_chunks()
+    values = pc.list_flatten(lists)
+    parents = pc.list_parent_indices(lists).to_numpy()
+    lengths = pc.fill_null(pc.list_value_length(lists), 0).to_numpy()
+    # position within its list, counted from where each parent's list starts
+    starts = np.cumsum(lengths) - lengths
+    positions = np.arange(len(parents)) - starts[parents]
+    parent_id = pc.take(parent_ids, pa.array(parents))
+
+    if pa.types.is_struct(values.type):
+        columns = {field.name: values.field(field.name) for field in values.type}
+    else:
+        columns = {"value": values}
+    columns["_dlt_root_id"] = parent_id
+    columns["_dlt_parent_id"] = parent_id
+    columns["_dlt_list_idx"] = pa.array(positions, pa.int64())
+    columns["_dlt_id"] = pa.array(
+        [
+            get_nested_row_hash(parent, table_name, position)
+            for parent, position in zip(parent_id.to_pylist(), positions.tolist())
+        ],
+        pa.string(),
+    )
+    columns[DELETED_COLUMN] = pa.nulls(len(parents), pa.bool_())
+    child = pa.table(columns)
+
+    # a parent whose list emptied gets a row flagged as deleted, so the delete
+    # by _dlt_root_id still clears the rows it had before
+    emptied = pc.take(parent_ids, pa.array(np.flatnonzero(lengths == 0)))
+    flagged = {
+        name: pa.nulls(len(emptied), field.type)
+        for name, field in zip(child.column_names, child.schema)
+    }
+    flagged["_dlt_root_id"] = emptied
+    flagged["_dlt_parent_id"] = emptied
+    flagged["_dlt_list_idx"] = pa.array([-1] * len(emptied), pa.int64())
+    flagged["_dlt_id"] = pa.array(
+        [get_nested_row_hash(parent, table_name, -1) for parent in emptied.to_pylist()],
+        pa.string(),
+    )
+    flagged[DELETED_COLUMN] = pa.array([True] * len(emptied), pa.bool_())
+    return pa.concat_tables([child, pa.table(flagged, schema=child.schema)])
+
+
+def normalize_table(table: pa.Table, table_name: str, merge: bool = True):
+    """
+    Turn a staged table into the arrow tables to load, column by column.
+
+    Struct columns are flattened into the table and list columns split out
+    into table_name__column child tables. Ids are the ones dlt gives upserted
+    rows and their child rows, so the dbt models joining on them are unchanged.
+    Child tables are replaced per parent, the rows of every parent in the
+    load are swapped for the new ones. Without merge, where the destination
+    appends, the rows flagged as deleted are left out.
+
+    dlt keeps the child tables as top level tables of the resource, so a
+    dataset loaded before staging was turned on needs its child tables
+    dropped from the pipeline schema first.
+    """
+    ids = pa.array(row_ids(table["appid"].to_pylist()), pa.string())
+    list_columns = [
+        field.name for field in table.schema if pa.types.is_list(field.type)
+    ]
+    parent = flatten_structs(table.drop_columns(list_columns))
+    yield parent.append_column("_dlt_id", ids)
+
+    for column in list_columns:
+        child_name = f"{table_name}__{column}"
+        child = nested_table(table[column], ids, child_name)
+        if not merge:
+            child = child.filter(pc.is_null(child[DELETED_COLUMN]))
+        yield dlt.mark.with_hints(
+            child,
+            dlt.mark.make_hints(
+                table_name=child_name,
+                write_disposition={
+                    "disposition": "merge",
+                    "strategy": "delete-insert",
+                },
+                primary_key=(),
+                merge_key="_dlt_root_id",
+                columns={DELETED_COLUMN: {"data_type": "bool", "hard_delete": True}},
+            ),
+            create_table_variant=True,
+        )
+
+
+def json_rows(table: pa.Table, columns: list) -> list:
+    """The staged rows as dicts, with the json text columns parsed back"""
+    rows = table.to_pylist()
+    for row in rows:
+        for column in columns:
+            if row[column] is not None:
+                row[column] = json.loads(row[column])
+    return rows
+
+
+def load_tables(table: pa.Table, source: str, table_name: str):
+    """
+    Yield a staged table the way the destination can load it.
+
+    BigQuery only loads json columns from jsonl, so there tables with json
+    columns go as rows for dlt to normalize itself.
+    """
+    json_columns = JSON_COLUMNS[source]
+    destination = dlt.current.pipeline().destination.destination_name
+    if json_columns and destination == "bigquery":
+        yield json_rows(table, json_columns)
+    else:
+        yield from normalize_table(table, table_name, merge=destination != "filesystem")
+
+
+def stage_batches(source: str, batches, table_name: str):
+    """
+    Stage each fetched batch and yield it as the tables to load, or
+    yield the batches as they are when staging is off.
+    """
+    staging = get_staging(source)
+    if staging is None:
+        yield from batches
+        return
+    for batch in batches:
+        yield from load_tables(staging.write(batch), source, table_name)
+
+
+def iter_staged(source: str, table_name: str, load_date: str = None):
+    """Yield the rows source staged on load_date as the tables to load"""
+    staging = get_staging(source)
+    if staging is None:
+        raise ValueError("RAW_STAGING_DIR must be set to load staged data")
+    table = staging.read(load_date)
+    logger.info(f"Loading {table.num_rows} staged {source} rows")
+    if table.num_rows:
+        yield from load_tables(table, source, table_name)
@@ -1,7 +1,11 @@
 import pandas as pd
+import numpy as np
 import logging
+from itertools import chain
 from typing import Dict, List, Union
 import hashlib
+import json
+from src.helpers.metrics import metrics
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -9,12 +13,14 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# placeholder tag for apps steamspy returned no tags for
+MISSING_TAGS = {"UNK": -1}
+
+
 def get_tag_unique_ids(df):
-    unique_id = [
-        hashlib.md5(f"{f.appid}{f.tag}".encode("utf-16")).hexdigest()
-        for f in df.itertuples()
-    ]
-    df["unique_id"] = unique_id
+    # build the appid+tag keys column-wise, only the md5 itself runs per row
+    keys = (df["appid"].astype(str) + df["tag"].astype(str)).tolist()
+    df["unique_id"] = [hashlib.md5(key.encode("utf-16")).hexdigest() for key in keys]
     return df
 
 
@@ -40,23 +46,30 @@ class GameDetailsProcessor:
         logger.info("GameDetailsProcessor initialized and data loaded successfully.")
 
     def create_tags_dataframe(self):
+        """
+        Explode the tags mapping into one row per appid and tag.
 
-        appids, tags, user_count = [], [], []
-
-        for row in self.details.itertuples():
-
-            if pd.isna(row.tags):
-                appids.append(row.appid)
-                tags.append("UNK")
-                user_count.append(-1)
-            else:
-                for k, v in row.tags.items():
-                    appids.append(row.appid)
-                    tags.append(k)
-                    user_count.append(v)
+        The appid column is repeated with numpy by the number of tags per app
+        and the tag names and counts are flattened in a single pass.
+        """
+        tag_maps = [
+            MISSING_TAGS if missing else tags
+            for tags, missing in zip(self.details["tags"], self.details["tags"].isna())
+        ]
+        # json columns come back as strings when read through arrow
+        tag_maps = [
+            json.loads(tags) if isinstance(tags, str) else tags for tags in tag_maps
+        ]
+        lengths = np.fromiter(map(len, tag_maps), dtype=np.int64, count=len(tag_maps))
 
         self.tags = pd.DataFrame(
-            {"appid": appids, "tag": tags, "user_count": user_count}
+            {
+                "appid": np.repeat(self.details["appid"].to_numpy(), lengths),
+                "tag": list(chain.from_iterable(tags.keys() for tags in tag_maps)),
+                "user_count": list(
+                    chain.from_iterable(tags.values() for tags in tag_maps)
+                ),
+            }
         )
         self.tags = get_tag_unique_ids(self.tags)
 
@@ -72,7 +85,8 @@ class GameDetailsProcessor:
         """
         logger.info("Starting full DataFrame cleaning process...")
         self.details = details
-        self.create_tags_dataframe()
+        with metrics.timer("clean_seconds", table="steam_user_tags"):
+            self.create_tags_dataframe()
 
         if drop_cols is None:
             drop_cols = [
@@ -84,12 +98,16 @@ class GameDetailsProcessor:
                 "owners",
                 "_dlt_load_id",
                 "_dlt_id",
+                "details_date",
             ]
-        self.convert_owners_range()
-        self.drop_columns(drop_cols)
-        self.clean_na()
-        self.convert_price_to_dollars()
-
+        with metrics.timer("clean_seconds", table="steam_spy"):
+            self.convert_owners_range()
+            self.drop_columns(drop_cols)
+            self.clean_na()
+            self.convert_price_to_dollars()
+
+        metrics.inc("rows_cleaned_total", len(self.details), table="steam_spy")
+        metrics.inc("rows_cleaned_total", len(self.tags), table="steam_user_tags")
         logger.info("DataFrame cleaning completed successfully.")
         return self.details, self.tags
 
@@ -1,6 +1,7 @@
 import pandas as pd
+import numpy as np
 import logging
-import time
+from src.helpers.metrics import metrics
 
 # Initialize the logger
 logging.basicConfig(
@@ -8,6 +9,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+PLATFORM_COLUMNS = ["platform__windows", "platform__linux", "platform__mac"]
+# every combination of platforms, indexed by the bit pattern of their flags
+PLATFORM_LABELS = np.array(
+    [
+        " ".join(
+            column for bit, column in enumerate(PLATFORM_COLUMNS) if code & (1 << bit)
+        )
+        for code in range(1 << len(PLATFORM_COLUMNS))
+    ],
+    dtype=object,
+)
+
 
 class SteamStoreProcessor:
 
@@ -22,20 +35,18 @@ class SteamStoreProcessor:
             pd.DataFrame: Cleaned DataFrame.
         """
 
-        start_time = time.time()
         logger.info("Starting the data cleaning process...")
 
-        self.process_platforms()
-        self.process_supported_languages()
-        self.process_controller_support()
-        self.process_release_dates()
-        self.process_descriptions()
-        self.return_cols()
+        with metrics.timer("clean_seconds", table="steam_store"):
+            self.process_platforms()
+            self.process_supported_languages()
+            self.process_controller_support()
+            self.process_release_dates()
+            self.process_descriptions()
+            self.return_cols()
 
-        end_time = time.time()
-        logger.info(
-            f"Data cleaning process completed in {end_time - start_time:.2f} seconds."
-        )
+        metrics.inc("rows_cleaned_total", len(self.steam_store), table="steam_store")
+        logger.info("Data cleaning process completed.")
         return self.steam_store
 
     def return_cols(self):
@@ -69,13 +80,16 @@ class SteamStoreProcessor:
         """
         Combine platform columns into a single 'platforms' column using vectorized operations.
         """
-        platforms = pd.DataFrame(
-            self.steam_store[["platform__windows", "platform__linux", "platform__mac"]]
-        )
-        platforms = platforms.apply(
-            lambda row: " ".join([key for key, value in row.items() if value]), axis=1
-        )
-        self.steam_store["platforms"] = platforms
+        platforms = self.steam_store[PLATFORM_COLUMNS]
+        values = platforms.to_numpy(dtype=object)
+        missing = platforms.isna().to_numpy()
+        flags = np.zeros(values.shape, dtype=bool)
+        flags[~missing] = values[~missing].astype(bool)
+        # as in a row-wise truth test, NaN counts as supported while None and
+        # NA do not
+        flags[missing] = [isinstance(value, float) for value in values[missing]]
+        codes = flags @ (1 << np.arange(len(PLATFORM_COLUMNS)))
+        self.steam_store["platforms"] = PLATFORM_LABELS[codes]
         logger.info("Platforms column processed successfully.")
 
     def process_supported_languages(self) -> None:
@@ -93,9 +107,10 @@ class SteamStoreProcessor:
         Convert 'controller_support' column to binary values (1 for 'full', 0 otherwise).
         Vectorized operations are used for efficiency.
         """
+        # arrow backed columns propagate nulls through the comparison
         self.steam_store["controller_support"] = (
-            self.steam_store["controller_support"] == "full"
-        ).astype(int)
+            (self.steam_store["controller_support"] == "full").fillna(False).astype(int)
+        )
         logger.info("Controller support processed successfully.")
 
     def process_release_dates(self) -> None:
@@ -130,7 +145,7 @@ class SteamStoreProcessor:
             "header_image",
         ]
 
-        self.steam_store["description"] = (
+        descriptions = (
             self.steam_store[required_columns]
             .fillna(
                 {
@@ -141,15 +156,22 @@ class SteamStoreProcessor:
                     "header_image": "Not available",
                 }
             )
-            .agg(
-                lambda row: f"{row['detailed_description']} {row['about_the_game']} {row['short_description']} "
-                f"Website: {row['website']} Game Image: {row['header_image']}",
-                axis=1,
-            )
+            .astype(str)
+        )
+        description = (
+            descriptions["detailed_description"]
+            + " "
+            + descriptions["about_the_game"]
+            + " "
+            + descriptions["short_description"]
+            + " Website: "
+            + descriptions["website"]
+            + " Game Image: "
+            + descriptions["header_image"]
         )
 
         # Handle any empty descriptions
-        self.steam_store["description"].replace("", "Not available", inplace=True)
+        self.steam_store["description"] = description.replace("", "Not available")
         self.steam_store.drop(columns=required_columns, inplace=True)
         logger.info("Descriptions processed successfully.")
 
@@ -1,8 +1,25 @@
+import json
 from datetime import datetime, timedelta
-import pandas as pd
 from typing import List
 import dlt
-import pandas as pd
+from dlt.destinations.exceptions import DatabaseUndefinedRelation
+
+# last fetch per appid, computed in the warehouse so only the requested and
+# stale appids come back instead of the whole table. a plain timestamp literal
+# keeps it valid on bigquery and duckdb alike
+freshness_query = """
+SELECT appid, MAX(date_added)
+FROM {table}
+GROUP BY appid
+HAVING appid IN ({appids}) OR MAX(date_added) < TIMESTAMP '{cutoff}';
+"""
+
+# stored values of a few columns for the requested appids
+stored_details_query = """
+SELECT appid, {columns}
+FROM {table}
+WHERE appid IN ({appids});
+"""
 
 
 def get_date() -> datetime:
@@ -10,18 +27,82 @@ def get_date() -> datetime:
     return datetime.now()
 
 
-def get_stale_data_ids(df, freshness_days=7):
+def get_last_fetched(
+    pipeline: dlt.pipeline, table_name: str, appids: list, freshness_days=7
+) -> dict:
+    """
+    Returns the last fetch date of each requested or stale appid in the table,
+    or None when nothing has been loaded into the table yet.
+    """
+    cutoff = datetime.now() - timedelta(days=freshness_days)
+    try:
+        with pipeline.sql_client() as client:
+            query = freshness_query.format(
+                table=client.make_qualified_table_name(table_name),
+                cutoff=cutoff.strftime("%Y-%m-%d %H:%M:%S"),
+                appids=", ".join(str(int(appid)) for appid in appids) or "NULL",
+            )
+            rows = client.execute_sql(query)
+    except DatabaseUndefinedRelation:
+        return None
+    return {appid: date_added.replace(tzinfo=None) for appid, date_added in rows or []}
+
+
+def get_stored_details(
+    pipeline: dlt.pipeline,
+    table_name: str,
+    appids: list,
+    columns: list,
+    json_columns: tuple = (),
+) -> dict:
+    """
+    Returns the stored values of columns for each requested appid in the
+    table, or an empty dict when nothing has been loaded into the table yet.
+    Json columns some destinations return as text are parsed.
+    """
+    try:
+        with pipeline.sql_client() as client:
+            query = stored_details_query.format(
+                table=client.make_qualified_table_name(table_name),
+                columns=", ".join(client.escape_column_name(c) for c in columns),
+                appids=", ".join(str(int(appid)) for appid in appids) or "NULL",
+            )
+            rows = client.execute_sql(query)
+    except DatabaseUndefinedRelation:
+        return {}
+    return {
+        appid: {
+            column: (
+                json.loads(value)
+                if column in json_columns and isinstance(value, str)
+                else value
+            )
+            for column, value in zip(columns, values)
+        }
+        for appid, *values in rows or []
+    }
+
+
+def get_stale_data_ids(last_fetched: dict, freshness_days=7) -> List:
     seven_days_ago = datetime.now() - timedelta(days=freshness_days)
-    df["date_added"] = pd.to_datetime(df["date_added"]).dt.tz_localize(None)
-    df_old = df[df["date_added"] < seven_days_ago]
-    df_latest_per_appid = (
-        df_old.sort_values("date_added").groupby("appid").last().reset_index()
-    )
-    return df_latest_per_appid["appid"].tolist()
+    return [appid for appid, date in last_fetched.items() if date < seven_days_ago]
+
 
+def get_refresh_dates(tables: list, appids: list) -> dict:
+    """
+    Combine the last fetch dates of each table, keeping the oldest per appid.
 
-def get_dataset(pipeline: dlt.pipeline, table_name: str):
-    return pipeline.dataset()[table_name].df()
+    Requested appids missing from any table are left out so they are treated
+    as never fetched.
+    """
+    requested = set(appids)
+    last_fetched = {}
+    for appid in requested.union(*tables):
+        dates = [table.get(appid) for table in tables]
+        if appid in requested and None in dates:
+            continue
+        last_fetched[appid] = min(date for date in dates if date is not None)
+    return last_fetched
 
 
 def deduplpication(current_data: List, database_data: List) -> List:
@@ -31,9 +112,9 @@ def deduplpication(current_data: List, database_data: List) -> List:
 
 def get_appids(pipeline: dlt.pipeline, table_name: str, appids: list, freshness_days=7):
 
-    dataset = get_dataset(pipeline, table_name)
+    last_fetched = get_last_fetched(pipeline, table_name, appids, freshness_days) or {}
 
-    missing_ids = deduplpication(appids, dataset["appid"].tolist())
-    old_data_ids = get_stale_data_ids(dataset, freshness_days=freshness_days)
+    missing_ids = deduplpication(appids, last_fetched)
+    old_data_ids = get_stale_data_ids(last_fetched, freshness_days=freshness_days)
 
     return list(set(missing_ids + old_data_ids))
@@ -1,8 +1,55 @@
-from pydantic import BaseModel, Field, HttpUrl, field_validator
-from typing import Dict, List, Optional, Union
+from pydantic import BaseModel, BeforeValidator, Field, TypeAdapter
+from typing import Annotated, Dict, List, Optional, Union
 from datetime import datetime
+import random
 import re
 
+AGE_PATTERN = re.compile(r"\d+")
+
+
+def empty_tags(v):
+    """steamspy sends an empty list rather than an object for apps without tags"""
+    if v == []:
+        return None
+    if v is not None and not isinstance(v, dict):
+        raise ValueError("Tags must be a dictionary or None")
+    return v
+
+
+def optional_int(v):
+    """steamspy sends prices as strings"""
+    return None if v is None else int(v)
+
+
+def number_to_str(v):
+    """steamspy sends score ranks as numbers, or an empty string without one"""
+    return v if v is None or isinstance(v, str) else str(v)
+
+
+def required_age(v):
+    """The store sends ages as ints or strings such as "18+" """
+    if isinstance(v, int):
+        return v
+    if isinstance(v, str):
+        match = AGE_PATTERN.search(v)
+        if match:
+            return int(match.group())
+    raise ValueError(f"Invalid value for required age {v}")
+
+
+def empty_requirements(v):
+    """The store sends an empty list rather than an object for no requirements"""
+    if isinstance(v, list):
+        return {}
+    return v
+
+
+# the few inputs core types cannot coerce, everything else is checked by the
+# compiled pydantic-core schema without calling back into python
+Tags = Annotated[Optional[dict[str, int]], BeforeValidator(empty_tags)]
+RequiredAge = Annotated[Optional[Union[int, str]], BeforeValidator(required_age)]
+Requirements = Annotated[Optional[Dict], BeforeValidator(empty_requirements)]
+
 
 class GameDetails(BaseModel):
     appid: int = Field(..., description="Steam Application ID")
@@ -15,7 +62,9 @@ class GameDetails(BaseModel):
         ..., description="comma separated list of the publishers of the game"
     )
     score_rank: str = Field(
-        "", description="score rank of the game based on user reviews"
+        "",
+        description="score rank of the game based on user reviews",
+        coerce_numbers_to_str=True,
     )
     positive: int = Field(..., description="number of positive reviews ")
     negative: int = Field(..., description="number of negative reviews ")
@@ -41,27 +90,11 @@ class GameDetails(BaseModel):
     ccu: int = Field("", description="peak CCU yesterday")
     languages: Optional[str] = Field(None, description="list of supported languages.")
     genre: Optional[str] = Field(None, description="list of genres.")
-    tags: Optional[dict[str, int]] = Field(
-        None, description="game's tags with votes in JSON array."
+    tags: Tags = Field(None, description="game's tags with votes in JSON array.")
+    details_date: Optional[datetime] = Field(
+        None, description="Date tags, languages and genre were last scraped"
     )
 
-    @field_validator("tags", mode="before")
-    def validate_tags(cls, v):
-        if v == []:
-            return None
-        if v is not None and not isinstance(v, dict):
-            raise ValueError("Tags must be a dictionary or None")
-        return v
-
-    @field_validator("score_rank", mode="before")
-    def validate_score_rank(cls, v):
-        if isinstance(v, int):
-            return int(v)
-
-        if v is not None and not isinstance(v, str):
-            raise ValueError("Score must be a string or integer")
-        return v
-
 
 class GameDetailsList(BaseModel):
     games: List[GameDetails] = Field(..., description="list of games")
@@ -101,9 +134,7 @@ class SteamGameMetadata(BaseModel):
     name: str = Field(..., description="game's name")
     appid: int = Field(..., description="Steam Application ID")
     date_added: datetime = Field(..., description="date scraped")
-    required_age: Optional[Union[int, str]] = Field(
-        ..., description="Required age to play the game"
-    )
+    required_age: RequiredAge = Field(..., description="Required age to play the game")
     is_free: bool = Field(..., description="is the game free")
     dlc: Optional[list[int]] = Field(
         ..., description="list of dlc id's associated with the game"
@@ -125,7 +156,7 @@ class SteamGameMetadata(BaseModel):
     header_image: str = Field(..., description="Url to the header image of the game ")
     capsule_image: str = Field(..., description="Url to the thumbnail of the game")
     website: Optional[str] = Field(..., description="The games website ")
-    requirements: Optional[Dict] = Field(
+    requirements: Requirements = Field(
         ..., description="PC system requirements for the game"
     )
     developers: Optional[List[str]] = Field(
@@ -154,58 +185,59 @@ class SteamGameMetadata(BaseModel):
         ..., description="Indicates if the game release is upcoming"
     )
 
-    @field_validator("header_image", mode="before")
-    def validate_header_image(cls, v):
-        if isinstance(v, HttpUrl):
-            v = str(v)
-        elif not isinstance(v, str):
-            raise ValueError(f"Invalid value for required age {v}")
-        return v
-
-    @field_validator("capsule_image", mode="before")
-    def validate_capsule_image(cls, v):
-        if isinstance(v, HttpUrl):
-            v = str(v)
-        elif not isinstance(v, str):
-            raise ValueError(f"Invalid value for required age {v}")
-        return v
-
-    @field_validator("website", mode="before")
-    def validate_website(cls, v):
-        if v is None:
-            return v
-        if isinstance(v, (HttpUrl, str)):  # Single value
-            return str(v)
-        if isinstance(v, list):  # List of URLs
-            new_v = []
-            for vv in v:
-                if isinstance(vv, HttpUrl):
-                    vv = str(vv)
-                elif not isinstance(vv, str):
-                    raise ValueError(f"Invalid value for website: {vv}")
-                new_v.append(vv)
-            return new_v
-        raise ValueError(f"Invalid value for website: {v}")
-
-    @field_validator("required_age", mode="before")
-    def validate_required_age(cls, v):
-        if isinstance(v, str):
-            match = re.search(r"\d+", v)
-            if match:
-                v = int(match.group())
-            else:
-                raise ValueError(f"Invalid value for required age {v}")
-        elif not isinstance(v, int):
-            raise ValueError(f"Invalid value for required age {v}")
-        return v
-
-    @field_validator("requirements", mode="before")
-    def validate_requirements(cls, v):
-        if isinstance(v, list):
-            return {}
-        else:
-            return v
-
 
 class SteamGameMetadataList(BaseModel):
     games: List[SteamGameMetadata] = Field(..., description="list of games")
+
+
+# list validators compiled once, so a batch is validated in a single call
+ADAPTERS = {
+    GameDetails: TypeAdapter(List[GameDetails]),
+    SteamGameMetadata: TypeAdapter(List[SteamGameMetadata]),
+}
+
+# the before validators of each model and the coercions of fields whose raw
+# json type differs from the model, applied to records that skip validation
+NORMALISERS = {
+    GameDetails: {
+        "tags": empty_tags,
+        "score_rank": number_to_str,
+        "price": optional_int,
+        "initialprice": optional_int,
+        "userscore": float,
+    },
+    SteamGameMetadata: {
+        "required_age": required_age,
+        "requirements": empty_requirements,
+    },
+}
+
+
+def validate_records(model, records: list, sample_rate: float = 0) -> list:
+    """
+    Validate a batch of records against model.
+
+    By default every record is validated. With a sample_rate only that share
+    of the batch, and at least one record, is validated and, once it passes,
+    the batch is passed on as plain dicts with only the model's input
+    normalisation applied. This is meant for sources trusted to keep their
+    schema, it skips both validation and building the models.
+    """
+    adapter = ADAPTERS[model]
+    if not sample_rate or not records:
+        return adapter.validate_python(records)
+
+    sample_size = min(len(records), max(1, round(len(records) * sample_rate)))
+    adapter.validate_python(random.sample(records, sample_size))
+    normalisers = NORMALISERS[model]
+    return [
+        {
+            **record,
+            **{
+                field: normalise(record[field])
+                for field, normalise in normalisers.items()
+                if field in record
+            },
+        }
+        for record in records
+    ]
@@ -0,0 +1,26 @@
+from src.apis.app_hash_store import AppHashStore
+
+
+def test_price_match_defers_full_fetch_only_within_max_age(tmp_path):
+    store = AppHashStore(str(tmp_path / "hash.db"), max_age_days=7)
+    store.unchanged_prices({1: {"final": 999}})
+    store.content_changed(1, {"name": "game", "price_overview": {"final": 999}})
+    store.commit()
+    fetched = store.checked_dates([1])[1]
+
+    assert store.unchanged_prices({1: {"final": 999}}) == {1}
+    store.commit()
+    # a price match is not a check of the full payload
+    assert store.checked_dates([1])[1] == fetched
+
+    store.max_age = 0
+    assert store.unchanged_prices({1: {"final": 999}}) == set()
+
+
+def test_changed_price_is_fetched(tmp_path):
+    store = AppHashStore(str(tmp_path / "hash.db"))
+    store.unchanged_prices({1: {"final": 999}})
+    store.content_changed(1, {"name": "game"})
+    store.commit()
+
+    assert store.unchanged_prices({1: {"final": 499}}) == set()
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.apis.base_api import ApiClient
+from src.apis.rate_limiter import RateLimiter
+
+
+class ThrottleOnce(BaseHTTPRequestHandler):
+    """Answers the first request with a 429 and Retry-After: 1"""
+
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        if self.hits == 1:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"ok": true}')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    ThrottleOnce.hits = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottleOnce)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/api"
+    server.shutdown()
+
+
+def client_for(url: str, paced: bool) -> ApiClient:
+    client = ApiClient()
+    client.cache = None
+    client.rate_limiter = RateLimiter()
+    if paced:
+        client.rate_limiter.configure(url, rate=100, burst=10)
+    return client
+
+
+def fetch(client: ApiClient, url: str, use_async: bool):
+    if not use_async:
+        return client.get_request(url, wait_time=30)
+
+    async def get():
+        async with client.async_client() as session:
+            return await client.async_get_request(session, url, wait_time=30)
+
+    return asyncio.run(get())
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+@pytest.mark.parametrize("paced", [True, False])
+def test_429_waits_retry_after_once(url, paced, use_async):
+    client = client_for(url, paced)
+
+    start = time.monotonic()
+    assert fetch(client, url, use_async) == {"ok": True}
+    elapsed = time.monotonic() - start
+
+    assert ThrottleOnce.hits == 2
+    # Retry-After alone, not stacked with the 30 second backoff
+    assert 1 <= elapsed < 3
@@ -0,0 +1,46 @@
+import dlt
+import pandas as pd
+import pytest
+
+import clean_pipeline
+
+
+def load_table(tmp_path, monkeypatch, arrow: bool, resource, unique_id: str):
+    """Load a frame the way the clean flow does and read it back by column"""
+    monkeypatch.setattr(clean_pipeline, "CLEAN_ARROW", arrow)
+    pipeline = dlt.pipeline(
+        pipeline_name=f"parity_{arrow}",
+        pipelines_dir=str(tmp_path / "pipelines"),
+        destination=dlt.destinations.duckdb(str(tmp_path / f"{arrow}.duckdb")),
+        dataset_name="parity",
+    )
+    frame = pd.DataFrame(
+        {unique_id: [1, 2, 3], "name": ["a", "b", "c"], "score": [1.5, 2.5, 3.5]}
+    )
+    pipeline.run(
+        resource(frame),
+        table_name="clean",
+        write_disposition={"disposition": "merge", "strategy": "upsert"},
+        primary_key=unique_id,
+    )
+    with pipeline.sql_client() as client:
+        with client.execute_query(
+            f"SELECT * FROM {client.make_qualified_table_name('clean')}"
+        ) as cursor:
+            return cursor.df().sort_values(unique_id).reset_index(drop=True)
+
+
+@pytest.mark.parametrize(
+    "resource, unique_id",
+    [
+        (clean_pipeline.yield_steamspy, "appid"),
+        (clean_pipeline.yield_tags, "unique_id"),
+    ],
+)
+def test_arrow_and_row_loads_match(tmp_path, monkeypatch, resource, unique_id):
+    rows = load_table(tmp_path, monkeypatch, False, resource, unique_id)
+    arrow = load_table(tmp_path, monkeypatch, True, resource, unique_id)
+
+    assert set(arrow.columns) == set(rows.columns)
+    assert "_dlt_id" in arrow.columns
+    assert arrow["_dlt_id"].tolist() == rows["_dlt_id"].tolist()
@@ -0,0 +1,36 @@
+import pytest
+from bs4 import BeautifulSoup
+
+from src.helpers.html_text import html_to_text
+
+
+def soup_text(text):
+    return BeautifulSoup(text, "lxml").get_text("\n", strip=True)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "<p>Plain paragraph</p>",
+        "<p>Fish &amp; Chips &lt;3 &eacute;t&eacute; &#8212; &nbsp;done</p>",
+        "<p>before<!-- a comment -->after</p>",
+        "<div>shown<script>var hidden = 1;</script><style>p {}</style>too</div>",
+        "first line<br>second line<br/>third<br />",
+        "<p>Some <b>bold <i>and italic</i></b> words, <a href='#'>a link</a>.</p>",
+        "<ul><li>one</li><li> two </li></ul>\n\n<h2>About</h2><p>text</p>",
+        "no tags at all",
+        "<img src='a.png'><p></p><div>   </div>",
+    ],
+)
+def test_matches_beautifulsoup(text):
+    assert html_to_text(text) == soup_text(text)
+
+
+@pytest.mark.parametrize("text", [" ", "\n\t  \n", "<p> </p>"])
+def test_whitespace_only(text):
+    assert html_to_text(text) == soup_text(text) == ""
+
+
+@pytest.mark.parametrize("text", ["", None])
+def test_empty_input(text):
+    assert html_to_text(text) is None
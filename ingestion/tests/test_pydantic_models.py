@@ -0,0 +1,88 @@
+import random
+from datetime import datetime
+
+import pytest
+from pydantic import ValidationError
+
+from benchmarks.synthetic import steamspy_payload, store_payload
+from src.apis.steam_metadetails import process_steam_data
+from src.models.pydantic_models import (
+    GameDetails,
+    SteamGameMetadata,
+    validate_records,
+)
+
+DATE_ADDED = datetime(2024, 1, 1)
+
+
+def steamspy_records(n: int = 200) -> list:
+    rng = random.Random(0)
+    return [
+        dict(steamspy_payload(rng, appid), date_added=DATE_ADDED)
+        for appid in range(1, n + 1)
+    ]
+
+
+def store_records(n: int = 200) -> list:
+    rng = random.Random(0)
+    return [
+        process_steam_data(store_payload(rng, appid)[f"{appid}"]["data"], DATE_ADDED)
+        for appid in range(1, n + 1)
+    ]
+
+
+@pytest.mark.parametrize(
+    "model, records",
+    [(GameDetails, steamspy_records()), (SteamGameMetadata, store_records())],
+)
+def test_trusted_mode_matches_validation(model, records):
+    validated = validate_records(model, records)
+    trusted = validate_records(model, records, sample_rate=0.05)
+
+    assert [
+        {field: record.get(field) for field in model.model_fields} for record in trusted
+    ] == [record.model_dump() for record in validated]
+
+
+def test_trusted_mode_validates_at_least_one_record():
+    record = dict(steamspy_records(1)[0], positive="many")
+
+    with pytest.raises(ValidationError):
+        validate_records(GameDetails, [record], sample_rate=0.001)
+
+
+@pytest.mark.parametrize(
+    "field, value, expected",
+    [
+        ("required_age", "18+", 18),
+        ("required_age", 16, 16),
+        ("requirements", [], {}),
+        ("website", None, None),
+    ],
+)
+def test_store_input_coercions(field, value, expected):
+    record = dict(store_records(1)[0], **{field: value})
+
+    assert getattr(SteamGameMetadata(**record), field) == expected
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [
+        ("required_age", "all ages"),
+        ("header_image", 1),
+        ("capsule_image", None),
+        ("website", ["https://a.example", "https://b.example"]),
+    ],
+)
+def test_store_invalid_inputs(field, value):
+    record = dict(store_records(1)[0], **{field: value})
+
+    with pytest.raises(ValidationError):
+        SteamGameMetadata(**record)
+
+
+def test_steamspy_empty_tags():
+    record = dict(steamspy_records(1)[0], tags=[])
+
+    assert GameDetails(**record).tags is None
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from src.helpers.scheduler import DEFAULT_BUDGET, RefreshScheduler
+
+
+def fetched_days_ago(days: float) -> datetime:
+    return datetime.now() - timedelta(days=days)
+
+
+def test_long_tail_apps_are_due_once_per_freshness_window():
+    last_fetched = {
+        1: fetched_days_ago(1),
+        2: fetched_days_ago(6),
+        3: fetched_days_ago(8),
+    }
+
+    assert RefreshScheduler().schedule([], last_fetched) == [3]
+
+
+def test_weighted_apps_fall_due_sooner():
+    ranks = [{"appid": 1, "rank": 1, "last_week_rank": 1}]
+    last_fetched = {1: fetched_days_ago(2), 2: fetched_days_ago(2)}
+
+    assert RefreshScheduler().schedule(ranks, last_fetched, {2: 10}) == [1]
+
+
+def test_default_budget_caps_a_run_in_priority_order():
+    last_fetched = {appid: fetched_days_ago(8 + appid % 30) for appid in range(10_000)}
+    last_fetched[-1] = None
+
+    scheduled = RefreshScheduler().schedule([], last_fetched)
+
+    assert len(scheduled) == DEFAULT_BUDGET
+    assert scheduled[0] == -1
+    left = set(last_fetched) - set(scheduled)
+    assert max(last_fetched[appid] for appid in scheduled[1:]) <= min(
+        last_fetched[appid] for appid in left
+    )
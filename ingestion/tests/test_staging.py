@@ -0,0 +1,134 @@
+import random
+from datetime import datetime, timezone
+
+import dlt
+import pytest
+
+from benchmarks.synthetic import steamspy_payload, store_payload
+from src.apis.steam_metadetails import process_steam_data
+from src.helpers.staging import DELETED_COLUMN, json_rows, stage_batches, steamspy_table
+from src.models.pydantic_models import (
+    GameDetails,
+    SteamGameMetadata,
+    validate_records,
+)
+
+DATE_ADDED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def store_batches() -> list:
+    rng = random.Random(0)
+    first = [
+        process_steam_data(store_payload(rng, appid)[f"{appid}"]["data"], DATE_ADDED)
+        for appid in range(1, 21)
+    ]
+    second = [
+        process_steam_data(store_payload(rng, appid)[f"{appid}"]["data"], DATE_ADDED)
+        for appid in range(11, 31)
+    ]
+    # lists that empty or vanish must clear the child rows of the first load
+    for record in second[:5]:
+        record.update(dlc=[], genres=None, categories=[], developers=[])
+    return [
+        validate_records(SteamGameMetadata, first),
+        validate_records(SteamGameMetadata, second),
+    ]
+
+
+def steamspy_batches() -> list:
+    rng = random.Random(0)
+    first = [
+        dict(steamspy_payload(rng, appid), date_added=DATE_ADDED)
+        for appid in range(1, 21)
+    ]
+    second = [
+        dict(steamspy_payload(rng, appid), date_added=DATE_ADDED)
+        for appid in range(11, 31)
+    ]
+    for record in second[:5]:
+        record["tags"] = []
+    return [
+        validate_records(GameDetails, first),
+        validate_records(GameDetails, second),
+    ]
+
+
+SOURCES = {
+    "steam_store": (store_batches, {}),
+    "steamspy": (steamspy_batches, {"tags": {"data_type": "json"}}),
+}
+
+
+def load(tmp_path, monkeypatch, source: str, staged: bool) -> dict:
+    """Load both batches of source, staged or directly, and read every table"""
+    if staged:
+        monkeypatch.setenv("RAW_STAGING_DIR", str(tmp_path / "staging"))
+    else:
+        monkeypatch.delenv("RAW_STAGING_DIR", raising=False)
+    batches, columns = SOURCES[source]
+
+    @dlt.resource(
+        name="details",
+        write_disposition={"disposition": "merge", "strategy": "upsert"},
+        primary_key="appid",
+        columns=columns,
+    )
+    def details(batch):
+        yield from stage_batches(source, iter([batch]), "details")
+
+    name = f"{source}_{'staged' if staged else 'direct'}"
+    pipeline = dlt.pipeline(
+        pipeline_name=name,
+        pipelines_dir=str(tmp_path / "pipelines"),
+        destination=dlt.destinations.duckdb(str(tmp_path / f"{name}.duckdb")),
+        dataset_name="ds",
+    )
+    for batch in batches():
+        pipeline.run(details(batch))
+
+    tables = {}
+    with pipeline.sql_client() as client:
+        for table_name in pipeline.default_schema.data_table_names():
+            with client.execute_query(
+                f"SELECT * FROM {client.make_qualified_table_name(table_name)}"
+            ) as cursor:
+                frame = cursor.df()
+            frame = frame.drop(
+                columns=["_dlt_load_id", DELETED_COLUMN], errors="ignore"
+            )
+            tables[table_name] = (
+                frame[sorted(frame.columns)]
+                .sort_values("_dlt_id")
+                .reset_index(drop=True)
+            )
+    return tables
+
+
+@pytest.mark.parametrize("source", list(SOURCES))
+def test_staged_load_matches_direct_load(tmp_path, monkeypatch, source):
+    direct = load(tmp_path, monkeypatch, source, staged=False)
+    staged = load(tmp_path, monkeypatch, source, staged=True)
+
+    assert sorted(staged) == sorted(direct)
+    for table_name, frame in direct.items():
+        # staged tables carry their whole arrow schema, dlt leaves out the
+        # columns no row had a value for yet
+        extra = set(staged[table_name].columns) - set(frame.columns)
+        assert staged[table_name][sorted(extra)].isna().all().all(), table_name
+        staged_frame = staged[table_name].drop(columns=sorted(extra))
+        assert list(staged_frame.columns) == list(frame.columns), table_name
+        assert staged_frame.astype(str).equals(frame.astype(str)), table_name
+
+
+def test_store_lists_become_child_tables(tmp_path, monkeypatch):
+    staged = load(tmp_path, monkeypatch, "steam_store", staged=True)
+
+    assert {"details__dlc", "details__genres", "details__developers"} <= set(staged)
+
+
+def test_bigquery_steamspy_rows_match_the_fetched_records():
+    # bigquery loads the staged steamspy rows as dicts for dlt to normalize
+    for batch in steamspy_batches():
+        rows = json_rows(steamspy_table(batch), ["tags"])
+
+        assert rows == [record.model_dump() for record in batch]
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from src.helpers.steamstore_cleaner import PLATFORM_COLUMNS, SteamStoreProcessor
+
+
+def reference_platforms(df: pd.DataFrame) -> pd.Series:
+    """The row-wise join process_platforms replaced"""
+    return df[PLATFORM_COLUMNS].apply(
+        lambda row: " ".join([key for key, value in row.items() if value]), axis=1
+    )
+
+
+def processed_platforms(df: pd.DataFrame) -> pd.Series:
+    processor = SteamStoreProcessor(df.copy())
+    processor.process_platforms()
+    return processor.steam_store["platforms"]
+
+
+def test_platforms_match_row_wise_join():
+    values = [True, False, None, np.nan]
+    combos = [(w, l, m) for w in values for l in values for m in values]
+    df = pd.DataFrame(combos, columns=PLATFORM_COLUMNS, dtype=object)
+
+    assert processed_platforms(df).tolist() == reference_platforms(df).tolist()
+
+
+def test_platforms_match_row_wise_join_for_float_columns():
+    df = pd.DataFrame(
+        {
+            "platform__windows": [1.0, np.nan, 0.0],
+            "platform__linux": [np.nan, np.nan, 1.0],
+            "platform__mac": [0.0, 1.0, np.nan],
+        }
+    )
+
+    assert processed_platforms(df).tolist() == reference_platforms(df).tolist()
+
+
+def test_platforms_treat_arrow_nulls_as_unsupported():
+    df = pd.DataFrame(
+        {column: [True, None] for column in PLATFORM_COLUMNS},
+        dtype=pd.ArrowDtype(pa.bool_()),
+    )
+
+    assert processed_platforms(df).tolist() == [" ".join(PLATFORM_COLUMNS), ""]